@@ -1,22 +1,33 @@
-import shutil
 import sys
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
+
+from rlbot.utils.maps import GAME_MAP_TO_UPK
 
 from bot_summary import create_bot_summary
 from bots import load_all_bots, defmt_bot_name, print_details, unzip_all_bots, load_retired_bots, save_retired_bots, \
     load_all_unretired_bots
+from career_stats import CareerStats, print_career
 from csv_conversion import convert_to_csvs
+from fileutil import file_lock
 from leaguesettings import LeagueSettings
 from match import MatchDetails
 from match_maker import TicketSystem, MatchMaker, make_timestamp
-from match_runner import run_match
-from overlay import make_summary, make_overlay
+from match_commit import commit_match, plan_rollback, rollback
+from match_coordinator import MatchCoordinator, run_worker, run_local, DEFAULT_PORT
+from match_index import MatchIndex, MatchFilter
+from match_runner import run_match, get_backend, MatchBackend, BACKENDS
+from overlay import make_summary, make_overlay, OverlayServer
 from paths import LeagueDir
+from process_monitor import aggregate_usage
 from prompt import prompt_yes_no
+from rank_confidence import rank_confidence, print_rank_confidence
 from ranking_system import RankingSystem
+from rating_trajectory import read_trajectory, PERIODS
 from replays import ReplayPreference
 from settings import PersistentSettings
+from stats_matrix import make_win_matrix
+from synergy import SynergyStats, print_synergy
 
 
 def main():
@@ -30,11 +41,17 @@ def parse_args(args: List[str]):
 
 Usage:
     autoleague setup league <league_dir>           Setup a league in <league_dir>
+    autoleague setup backend <rlbot|simulated>     Set whether matches are played in the game or simulated
+    autoleague setup telemetry <rate>              Record the game state <rate> times per second during matches (0 = off)
+    autoleague setup mercy <goals> [seconds]       End matches early when a team leads by <goals> with [seconds] left (0 = off)
+    autoleague setup tmcp <rate>                   Write the TMCP overlay's data at most <rate> times per second
     autoleague bot list [showRetired]              Print list of all known bots
     autoleague bot test <bot_id>                   Run test match using a specific bot
     autoleague bot details <bot_id>                Print details about the given bot
     autoleague bot unzip                           Unzip all bots in the bot directory
     autoleague bot summary                         Create json file with bot descriptions
+    autoleague bot perf <bot_id>                   Print the CPU and memory usage of a bot across its matches
+    autoleague bot stats <bot_id>                  Print the career stats of a bot, in total and per map
     autoleague ticket get <bot_id>                 Get the number of tickets owned by <bot_id>
     autoleague ticket set <bot_id> <tickets>       Set the number of tickets owned by <bot_id>
     autoleague ticket list [showRetired]           Print list of number of tickets for all bots
@@ -42,16 +59,27 @@ Usage:
     autoleague ticket ticketIncreaseRate <rate>    Set the rate at which tickets increase
     autoleague ticket gameCatchupBoost <boost>     Set the extra ticket increase factor when a bot has played fewer games
     autoleague rank list [showRetired]             Print list of the current leaderboard
-    autoleague match run                           Run a standard 3v3 soccer match
+    autoleague rank confidence [n] [workers]       Estimate the rank intervals of the bots from [n] resamples of the matches
+    autoleague match run [n]                       Run [n] standard 3v3 soccer matches (default 1)
     autoleague match prepare                       Run a standard 3v3 soccer match, but confirm match before starting
+    autoleague match serve <n> [port]              Coordinate <n> matches played in parallel by workers (default port 8766)
+    autoleague match work [host] [port]            Play matches handed out by a coordinator
+    autoleague match local <n> <workers>           Play <n> simulated matches in parallel using local workers
     autoleague match undo                          Undo the last match
-    autoleague match list [n]                      Show the latest matches
+    autoleague match rollback <id> [--dry-run]     Undo the given match and all matches after it
+    autoleague match list [n] [filters]            Show the latest [n] matches, see 'autoleague match help' for filters
     autoleague summary [n]                         Create a summary of the last [n] matches
     autoleague retirement list                     Print all bots in retirement
     autoleague retirement retire <bot>             Retire a bot, removing it from play and the leaderboard
     autoleague retirement unretire <bot>           Unretire a bot
     autoleague retirement retireall                Retire all bots
-    autoleague csvs generate                       Generate csv files with league data
+    autoleague stats matrix [--render]             Save the win, loss, draw, and win rate matrices of all bots, optionally as an image
+    autoleague stats synergy <bot_id>              Print the record of <bot_id> with and against each other bot
+    autoleague stats mmr <bot_id> [daily|weekly]   Print the mmr history of <bot_id>, optionally one value per day/week
+    autoleague csvs generate [--incremental]       Generate csv files with league data, or append only the new data
+    autoleague csvs generate --parallel            Generate the csv tables in parallel processes (works with --incremental)
+    autoleague csvs generate --format npz          Generate compressed NumPy files instead of csv files (works with --parallel)
+    autoleague overlay serve [port]                Serve the overlays and push updates to them (default port 8765)
     autoleague help                                Print this message"""
 
     if len(args) == 0 or args[0] == "help":
@@ -68,16 +96,27 @@ Usage:
         parse_subcommand_match(args)
     elif args[0] == "retirement":
         parse_subcommand_retirement(args)
+    elif args[0] == "stats":
+        parse_subcommand_stats(args)
     elif args[0] == "summary" and (1 <= len(args) <= 2):
 
         count = int(args[1]) if len(args) == 2 else 0
         ld = require_league_dir()
         make_summary(ld, count)
         print(f"Created summary of the last {count} matches")
-    elif args[0] == "csvs" and len(args) == 2 and args[1] == "generate":
+    elif args[0] == "csvs" and args[1:2] == ["generate"] and parse_csvs_format(args) is not None:
         ld = require_league_dir()
-        convert_to_csvs(ld)
-        print("Generated CSV files with league data")
+        fmt = parse_csvs_format(args)
+        flags = [arg for arg in args[2:] if arg not in ("--format", fmt)]
+        match_count = convert_to_csvs(ld, incremental="--incremental" in flags, parallel="--parallel" in flags,
+                                      fmt=fmt)
+        print(f"Generated {fmt.upper()} files with league data ({match_count} new matches)")
+    elif args[0] == "overlay" and (2 <= len(args) <= 3) and args[1] == "serve":
+        port = int(args[2]) if len(args) == 3 else 8765
+        try:
+            OverlayServer(port=port).run()
+        except KeyboardInterrupt:
+            print("Overlay server stopped")
     else:
         print(help_msg)
 
@@ -85,7 +124,11 @@ Usage:
 def parse_subcommand_setup(args: List[str]):
     assert args[0] == "setup"
     help_msg = """Usage:
-    autoleague setup league <league_dir>         Setup a league in <league_dir>"""
+    autoleague setup league <league_dir>         Setup a league in <league_dir>
+    autoleague setup backend <rlbot|simulated>   Set whether matches are played in the game or simulated
+    autoleague setup telemetry <rate>            Record the game state <rate> times per second during matches (0 = off)
+    autoleague setup mercy <goals> [seconds]     End matches early when a team leads by <goals> with [seconds] left (0 = off)
+    autoleague setup tmcp <rate>                 Write the TMCP overlay's data at most <rate> times per second"""
 
     if len(args) == 1 or args[1] == "help":
         print(help_msg)
@@ -103,6 +146,67 @@ def parse_subcommand_setup(args: List[str]):
 
         print(f"Working directory successfully set to '{league_path}'")
 
+    elif args[1] == "backend" and len(args) == 3:
+
+        backend = args[2]
+        if backend not in BACKENDS:
+            print(f"Unknown match backend '{backend}'. Options: {', '.join(BACKENDS.keys())}")
+        else:
+            ld = require_league_dir()
+            league_settings = LeagueSettings.load(ld)
+            league_settings.match_backend = backend
+            league_settings.save(ld)
+
+            print(f"Matches now use the {backend} backend")
+
+    elif args[1] == "telemetry" and len(args) == 3:
+
+        rate = float(args[2])
+        if rate < 0.0:
+            print("The telemetry rate must be 0.0 or greater")
+        else:
+            ld = require_league_dir()
+            league_settings = LeagueSettings.load(ld)
+            league_settings.telemetry_rate = rate
+            league_settings.save(ld)
+
+            if rate == 0.0:
+                print("Disabled telemetry recording")
+            else:
+                print(f"Updated telemetry rate to {rate} samples per second")
+
+    elif args[1] == "mercy" and (3 <= len(args) <= 4):
+
+        goal_difference = int(args[2])
+        if goal_difference < 0:
+            print("The goal difference must be 0 or greater")
+        else:
+            ld = require_league_dir()
+            league_settings = LeagueSettings.load(ld)
+            league_settings.mercy_goal_difference = goal_difference
+            if len(args) == 4:
+                league_settings.mercy_time_remaining = float(args[3])
+            league_settings.save(ld)
+
+            if goal_difference == 0:
+                print("Disabled the mercy rule")
+            else:
+                print(f"Matches now end when a team leads by {goal_difference} goals "
+                      f"with {league_settings.mercy_time_remaining} seconds or less remaining")
+
+    elif args[1] == "tmcp" and len(args) == 3:
+
+        rate = float(args[2])
+        if rate <= 0.0:
+            print("The TMCP write rate must be greater than 0.0")
+        else:
+            ld = require_league_dir()
+            league_settings = LeagueSettings.load(ld)
+            league_settings.tmcp_write_rate = rate
+            league_settings.save(ld)
+
+            print(f"The TMCP overlay now writes its data at most {rate} times per second")
+
     else:
         print(help_msg)
 
@@ -114,7 +218,9 @@ def parse_subcommand_bot(args: List[str]):
     autoleague bot test <bot_id>              Run test match using a specific bot
     autoleague bot details <bot_id>           Print details about the given bot
     autoleague bot unzip                      Unzip all bots in the bot directory
-    autoleague bot summary                    Create json file with bot descriptions"""
+    autoleague bot summary                    Create json file with bot descriptions
+    autoleague bot perf <bot_id>              Print the CPU and memory usage of a bot across its matches
+    autoleague bot stats <bot_id>             Print the career stats of a bot, in total and per map"""
 
     ld = require_league_dir()
 
@@ -180,6 +286,25 @@ def parse_subcommand_bot(args: List[str]):
         create_bot_summary(ld)
         print("Bot summary created")
 
+    elif args[1] == "perf" and len(args) == 3:
+
+        bot = args[2]
+        usages = [match.resource_usage[bot] for match in MatchDetails.all(ld) if bot in match.resource_usage]
+        if len(usages) == 0:
+            print(f"No resource usage has been recorded for '{bot}'")
+            return
+
+        usage = aggregate_usage(usages)
+        print(f"Resource usage of {bot} across {len(usages)} matches:")
+        print(f"CPU (% of a core):  avg {usage.cpu_avg:>7.1f}   peak {usage.cpu_peak:>7.1f}")
+        print(f"Memory (MB):        avg {usage.rss_avg:>7.1f}   peak {usage.rss_peak:>7.1f}")
+        print(f"Threads:            avg {usage.threads_avg:>7.1f}   peak {usage.threads_peak:>7}")
+        print(f"CPU time per match: {usage.cpu_time / len(usages):.1f} s")
+
+    elif args[1] == "stats" and len(args) == 3:
+
+        print_career(CareerStats.load(ld), args[2])
+
     else:
         print(help_msg)
 
@@ -215,7 +340,8 @@ def parse_subcommand_ticket(args: List[str]):
         tickets = int(args[3])
         ticket_sys = TicketSystem.load(ld)
         ticket_sys.set(bot, tickets)
-        ticket_sys.save(ld, make_timestamp())
+        with file_lock(ld.history_lock):
+            ticket_sys.save(ld, make_timestamp(after=ld.latest_time_stamp()))
         print(f"Successfully set the number of tickets of {bot} to {tickets}")
 
     elif args[1] == "list" and (len(args) == 2 or len(args) == 3):
@@ -283,7 +409,8 @@ def parse_subcommand_ticket(args: List[str]):
 def parse_subcommand_rank(args: List[str]):
     assert args[0] == "rank"
     help_msg = """Usage:
-        autoleague rank list [showRetired]  Print list of the current leaderboard"""
+        autoleague rank list [showRetired]          Print list of the current leaderboard
+        autoleague rank confidence [n] [workers]    Estimate the rank intervals of the bots from [n] resamples of the matches (default 1000)"""
 
     ld = require_league_dir()
 
@@ -301,6 +428,16 @@ def parse_subcommand_rank(args: List[str]):
         rank_sys.ensure_all(list(bots.keys()))
         rank_sys.print_ranks_and_mmr(exclude)
 
+    elif args[1] == "confidence" and 2 <= len(args) <= 4:
+
+        resamples = int(args[2]) if len(args) >= 3 else 1000
+        workers = int(args[3]) if len(args) == 4 else None
+        if len(MatchDetails.latest(ld, 1)) == 0:
+            print("No matches have been played yet.")
+            return
+        print(f"Replaying {resamples} resamples of the match history...")
+        print_rank_confidence(rank_confidence(ld, resamples, workers, exclude=load_retired_bots(ld)))
+
     else:
         print(help_msg)
 
@@ -308,64 +445,54 @@ def parse_subcommand_rank(args: List[str]):
 def parse_subcommand_match(args: List[str]):
     assert args[0] == "match"
     help_msg = """Usage:
-    autoleague match run                        Run a standard 3v3 soccer match
+    autoleague match run [n]                    Run [n] standard 3v3 soccer matches (default 1)
     autoleague match prepare                    Run a standard 3v3 soccer match, but confirm match before starting
+    autoleague match serve <n> [port]           Coordinate <n> matches played in parallel by workers (default port 8766)
+    autoleague match work [host] [port]         Play matches handed out by a coordinator
+    autoleague match local <n> <workers>        Play <n> simulated matches in parallel using local workers
     autoleague match undo                       Undo the last match
-    autoleague match list [n]                   Show the latest matches"""
+    autoleague match rollback <id> [--dry-run]  Undo the given match and all matches after it
+    autoleague match list [n] [filters]         Show the latest [n] matches. Filters:
+        --bot <bot_id>                          Only matches with <bot_id> (can be repeated)
+        --map <map>                             Only matches on <map> (name like ChampionsField or UPK name)
+        --since <YYYYMMDD>                      Only matches on or after the date
+        --until <YYYYMMDD>                      Only matches on or before the date
+        --margin <goals>                        Only matches won by at least <goals>
+        --page <p>                              Show the <p>th page of [n] matches counting from the latest"""
 
     ld = require_league_dir()
 
     if len(args) == 1 or args[1] == "help":
         print(help_msg)
 
-    elif (args[1] == "run" or args[1] == "prepare") and len(args) == 2:
+    elif (args[1] == "run" and 2 <= len(args) <= 3) or (args[1] == "prepare" and len(args) == 2):
 
-        # Load
-        bots = load_all_unretired_bots(ld)
-        rank_sys = RankingSystem.load(ld)
-        ticket_sys = TicketSystem.load(ld)
+        count = int(args[2]) if len(args) == 3 else 1
+        backend = get_backend(LeagueSettings.load(ld).match_backend)
+        for i in range(count):
+            if count > 1:
+                print(f"Match {i + 1}/{count}")
+            if not play_match(ld, backend, confirm=args[1] == "prepare", print_ranks=(i == count - 1)):
+                break
 
-        # Run
-        match = MatchMaker.make_next(bots, rank_sys, ticket_sys)
-        make_overlay(ld, match, bots)
-        # Ask before starting?
-        if args[1] == "run" or prompt_yes_no("Start match?", default="yes"):
-            result, replay = run_match(ld, match, bots, get_replay_data=True)
-            match.result = result
-
-            # Update ranks
-            rank_sys.update(match, result)
-
-            # Save replay
-            if replay is None:
-                print(f"WARNING: No replay was found for the match '{match.name}'.")
-            else:
-                match.replay_id = replay.replay_id
+    elif args[1] == "serve" and 3 <= len(args) <= 4:
 
-                try:
-                    dst = ld.replays / f"{replay.replay_id}.replay"
-                    shutil.copy(replay.replay_path, dst)
-                    print("Replay successfully copied to replays directory")
-                except:
-                    print("WARNING: Fail to copy replay to replays directory.")
+        port = int(args[3]) if len(args) == 4 else DEFAULT_PORT
+        try:
+            MatchCoordinator(ld, int(args[2]), port=port).run()
+        except KeyboardInterrupt:
+            print("Coordinator stopped")
 
-                # if replay_preference == ReplayPreference.CALCULATED_GG:
-                #     upload_to_calculated_gg(replay.replay_path)
+    elif args[1] == "work" and len(args) <= 4:
 
-            # Save
-            match.save(ld)
-            rank_sys.save(ld, match.time_stamp)
-            ticket_sys.save(ld, match.time_stamp)
+        host = args[2] if len(args) >= 3 else "localhost"
+        port = int(args[3]) if len(args) == 4 else DEFAULT_PORT
+        backend = get_backend(LeagueSettings.load(ld).match_backend)
+        run_worker(ld, backend, host, port)
 
-            # Print new ranks
-            rank_sys.print_ranks_and_mmr()
+    elif args[1] == "local" and len(args) == 4:
 
-            # Make summary
-            league_settings = LeagueSettings.load(ld)
-            make_summary(ld, league_settings.last_summary + 1)
-            print(f"Created summary of the last {league_settings.last_summary + 1} matches.")
-        else:
-            print("Match cancelled.")
+        run_local(ld, int(args[2]), int(args[3]))
 
     elif args[1] == "undo" and len(args) == 2:
 
@@ -382,9 +509,7 @@ def parse_subcommand_match(args: List[str]):
             if prompt_yes_no("Are you sure you want to undo the latest match?"):
 
                 # Undo latest update to all systems
-                RankingSystem.undo(ld)
-                TicketSystem.undo(ld)
-                MatchDetails.undo(ld)
+                rollback(ld, plan_rollback(ld, latest_match.time_stamp))
 
                 # New latest match
                 new_latest_match = MatchDetails.latest(ld, 1)
@@ -393,21 +518,51 @@ def parse_subcommand_match(args: List[str]):
                 else:
                     print("Reverted to beginning of league (no matches left)")
 
-    elif args[1] == "list" and len(args) <= 3:
+    elif args[1] == "rollback" and (len(args) == 3 or (len(args) == 4 and args[3] == "--dry-run")):
+
+        dry_run = len(args) == 4
+        plan = plan_rollback(ld, args[2])
+        if plan is None:
+            print(f"No match with the id '{args[2]}'")
+        else:
+            print(f"Rolling back to before {plan.match.name} removes {len(plan.matches)} matches:")
+            for path in plan.matches:
+                print(f"  {path.stem}")
+            print(f"and {len(plan.snapshots)} rankings and tickets snapshots.")
+
+            if dry_run:
+                print("Dry run. Nothing was removed.")
+            elif prompt_yes_no(f"Are you sure you want to remove {len(plan.matches)} matches?"):
+                rollback(ld, plan)
+                new_latest_match = MatchDetails.latest(ld, 1)
+                if new_latest_match:
+                    print(f"Reverted to {new_latest_match[0].name}")
+                else:
+                    print("Reverted to beginning of league (no matches left)")
 
-        count = 999999
-        if len(args) == 3:
-            count = int(args[2])
+    elif args[1] == "list" and parse_match_list(args) is not None:
 
-        # Show list of latest n matches played
-        latest_matches = MatchDetails.latest(ld, count)
-        if len(latest_matches) == 0:
-            print("No matches have been played yet.")
+        count, page, match_filter = parse_match_list(args)
+        index = MatchIndex.load(ld)
+        if count is None:
+            # Stream all matching matches, oldest first
+            rows = index.query(match_filter)
+        else:
+            # Show page of the latest n matching matches in chronological order
+            rows = reversed(list(index.query(match_filter, limit=count, offset=(page - 1) * count, newest_first=True)))
+
+        shown = 0
+        for row in rows:
+            if shown == 0:
+                print("Match history:")
+            shown += 1
+            print(
+                f"{row.time_stamp}: {', '.join(row.blue) + ' ':.<46} {row.blue_goals} VS {row.orange_goals} {' ' + ', '.join(row.orange):.>46}")
+        index.close()
+        if shown == 0:
+            print("No matches found.")
         else:
-            print(f"Match history (latest {len(latest_matches)} matches):")
-            for match in latest_matches:
-                print(
-                    f"{match.time_stamp}: {', '.join(match.blue) + ' ':.<46} {match.result.blue_goals} VS {match.result.orange_goals} {' ' + ', '.join(match.orange):.>46}")
+            print(f"({shown} matches)")
 
     else:
         print(help_msg)
@@ -477,6 +632,122 @@ def parse_subcommand_retirement(args: List[str]):
         print(help_msg)
 
 
+def parse_subcommand_stats(args: List[str]):
+    assert args[0] == "stats"
+    help_msg = """Usage:
+    autoleague stats matrix [--render]             Save the win, loss, draw, and win rate matrices of all bots, optionally as an image
+    autoleague stats synergy <bot_id>              Print the record of <bot_id> with and against each other bot
+    autoleague stats mmr <bot_id> [daily|weekly]   Print the mmr history of <bot_id>, optionally one value per day/week"""
+
+    if len(args) == 1 or args[1] == "help":
+        print(help_msg)
+
+    elif args[1] == "matrix" and (len(args) == 2 or args[2:] == ["--render"]):
+
+        ld = require_league_dir()
+        make_win_matrix(ld, render="--render" in args)
+
+    elif args[1] == "synergy" and len(args) == 3:
+
+        ld = require_league_dir()
+        print_synergy(SynergyStats.load(ld), args[2])
+
+    elif args[1] == "mmr" and (len(args) == 3 or (len(args) == 4 and args[3] in PERIODS)):
+
+        ld = require_league_dir()
+        period = args[3] if len(args) == 4 else None
+        trajectory = read_trajectory(ld, args[2], period)
+        if len(trajectory) == 0:
+            print(f"'{args[2]}' has no rating history")
+        else:
+            print(f"MMR history of {args[2]}:")
+            print(f"{'time': <20} {'mmr':>4} {'mu':>7} {'sigma':>7}")
+            for time_stamp, mu, sigma in trajectory:
+                print(f"{time_stamp: <20} {round(mu - sigma):>4} {mu:>7.2f} {sigma:>7.2f}")
+
+    else:
+        print(help_msg)
+
+
+def play_match(ld: LeagueDir, backend: MatchBackend, confirm: bool, print_ranks: bool = True) -> bool:
+    """
+    Make the next match, play it using the given backend, and commit the result.
+    Returns false if the match was cancelled.
+    """
+    # Load
+    bots = load_all_unretired_bots(ld)
+    rank_sys = RankingSystem.load(ld)
+    ticket_sys = TicketSystem.load(ld)
+
+    # Run
+    match = MatchMaker.make_next(bots, rank_sys, ticket_sys)
+    make_overlay(ld, match, bots)
+    # Ask before starting?
+    if confirm and not prompt_yes_no("Start match?", default="yes"):
+        print("Match cancelled.")
+        return False
+
+    result, replay = backend.run(ld, match, bots, get_replay_data=True)
+    commit_match(ld, match, result, replay, rank_sys, ticket_sys, bots)
+
+    # Print new ranks
+    if print_ranks:
+        rank_sys.print_ranks_and_mmr()
+    print(f"Created summary of the last {LeagueSettings.load(ld).last_summary} matches.")
+    return True
+
+
+def parse_csvs_format(args: List[str]) -> Optional[str]:
+    """
+    Returns the format of a `csvs generate` command ("csv" unless `--format <fmt>` is given) or None if the
+    arguments are invalid.
+    """
+    flags = args[2:]
+    fmt = "csv"
+    if "--format" in flags:
+        i = flags.index("--format")
+        if i + 1 >= len(flags):
+            return None
+        fmt = flags[i + 1]
+        flags = flags[:i] + flags[i + 2:]
+    if fmt not in ("csv", "npz") or not set(flags) <= {"--incremental", "--parallel"}:
+        return None
+    return fmt
+
+
+def parse_match_list(args: List[str]) -> Optional[Tuple[Optional[int], int, MatchFilter]]:
+    """
+    Returns the count, the page, and the filter of a `match list` command or None if the arguments are invalid
+    """
+    options = args[2:]
+    count = None
+    if options and not options[0].startswith("--"):
+        if not options[0].isdigit():
+            return None
+        count = int(options[0])
+        options = options[1:]
+    if len(options) % 2 != 0:
+        return None
+
+    page = 1
+    match_filter = MatchFilter()
+    for option, value in zip(options[::2], options[1::2]):
+        if option == "--bot":
+            match_filter.bots.append(value)
+        elif option == "--map":
+            # The index stores the UPK names of the maps
+            match_filter.map = GAME_MAP_TO_UPK.get(value, value)
+        elif option in ("--since", "--until") and len(value) == 8 and value.isdigit():
+            setattr(match_filter, option[2:], value)
+        elif option == "--margin" and value.isdigit():
+            match_filter.min_margin = int(value)
+        elif option == "--page" and value.isdigit() and int(value) >= 1 and count is not None:
+            page = int(value)
+        else:
+            return None
+    return count, page, match_filter
+
+
 def require_league_dir() -> LeagueDir:
     """
     Returns the WorkingDir and exits the program if it is not set.
@@ -1,6 +1,7 @@
 import json
 
 from bots import load_all_bots, defmt_bot_name
+from career_stats import CareerStats
 from paths import LeagueDir
 from ranking_system import RankingSystem
 
@@ -11,12 +12,13 @@ def create_bot_summary(ld: LeagueDir):
     """
 
     bots = load_all_bots(ld)
-    rankings = RankingSystem.load(ld).ensure_all(list(bots.keys()))
-    rank_list = rankings.as_sorted_list()
+    leaderboard = RankingSystem.load(ld).ensure_all(list(bots.keys())).leaderboard
+    career_stats = CareerStats.load(ld)
 
     def bot_data(bot_id):
         config = bots[bot_id]
-        rank, mmr = [(i + 1, mrr) for i, (id, mrr, sigma) in enumerate(rank_list) if id == bot_id][0]
+        rank = leaderboard.rank(bot_id)
+        mmr = leaderboard.mmr(bot_id)
         return {
             "name": config["settings"]["name"],
             "developer": config["details"].get("developer", "N/A"),
@@ -26,6 +28,8 @@ def create_bot_summary(ld: LeagueDir):
             "language": config["details"].get("language", "N/A"),
             "rank": rank,
             "mmr": mmr,
+            "career": career_stats.career(bot_id),
+            "maps": career_stats.map_careers(bot_id),
         }
 
     bot_summary = {defmt_bot_name(bot_id): bot_data(bot_id) for bot_id in bots.keys()}
@@ -1,8 +1,11 @@
+import hashlib
 import json
 import os
+import shutil
 import tomllib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Mapping, Set, Any, Generator
+from typing import Dict, Mapping, Set, Any, Generator, Optional, Tuple
 from zipfile import ZipFile
 
 from paths import PackageFiles, LeagueDir
@@ -10,6 +13,9 @@ from paths import PackageFiles, LeagueDir
 BotID = str
 BotTomlConfig = dict
 
+# Prefix of temporary folders used while unzipping bots
+UNZIP_TMP_PREFIX = ".unzipping_"
+
 
 def fmt_bot_name(name: str) -> BotID:
     return name.replace(" ", "_")
@@ -21,6 +27,9 @@ def defmt_bot_name(name: BotID) -> str:
 
 def scan_dir_for_bot_configs(dir: Path) -> Generator[BotTomlConfig, Any, None]:
     for file in dir.rglob("*bot.toml"):
+        if any(part.startswith(UNZIP_TMP_PREFIX) for part in file.parts):
+            # Bot is still being unzipped
+            continue
         with open(file, "rb") as f:
             config = tomllib.load(f)
             config.setdefault("settings", dict())
@@ -81,21 +90,113 @@ def print_details(config: BotTomlConfig):
     print(f"Logo path:    {config['settings'].get('logo_file', 'N/A')}")
 
 
-def unzip_all_bots(ld: LeagueDir):
+def unzip_all_bots(ld: LeagueDir, workers: Optional[int] = None):
     """
-    Unzip all zip files in the bot directory
+    Unzip all zip files in the bot directory. The archives are extracted in parallel, and archives with the
+    same content as when they were last extracted are skipped. Each archive is extracted into a temporary
+    folder first, which is then renamed into place, such that half-extracted bots never appear.
     """
+    record = load_unzip_record(ld)
+    archives = []
     for root, dirs, files in os.walk(ld.bots, topdown=True):
-        dirs[:] = [d for d in dirs]
+        # Skip temporary folders from unfinished extractions
+        dirs[:] = [d for d in dirs if not d.startswith(UNZIP_TMP_PREFIX)]
         for file in files:
-            if ".zip" in file:
-                path = os.path.join(root, file)
-                with ZipFile(path, "r") as zipObj:
-                    # Extract all the contents of zip file in current directory
-                    print(f"Extracting {path}")
-                    folder_name = os.path.splitext(os.path.basename(path))[0]
-                    target_dir = os.path.join(root, folder_name)
-                    zipObj.extractall(path=target_dir)
+            if file.lower().endswith(".zip"):
+                archives.append(os.path.join(root, file))
+
+    if len(archives) == 0:
+        print("No zip files found")
+        return
+
+    extracted = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(unzip_bot, path, record.get(os.path.relpath(path, ld.bots))): path
+            for path in archives
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                digest, did_extract = future.result()
+            except Exception as e:
+                print(f"> Warning: Failed to extract {path}: {e}")
+                continue
+            record[os.path.relpath(path, ld.bots)] = digest
+            if did_extract:
+                extracted += 1
+                print(f"Extracted {path}")
+            else:
+                print(f"Skipped {path} (unchanged)")
+
+    save_unzip_record(ld, record)
+    print(f"Extracted {extracted} of {len(archives)} zip files")
+
+
+def unzip_bot(path: str, known_hash: Optional[str]) -> Tuple[str, bool]:
+    """
+    Extract the given zip file into a folder of the same name next to it, unless the folder exists and the
+    content hash of the zip file matches `known_hash`. Returns the content hash and whether it was extracted.
+    This function is run in a worker process by `unzip_all_bots`.
+    """
+    digest = file_hash(path)
+    root = os.path.dirname(path)
+    folder_name = os.path.splitext(os.path.basename(path))[0]
+    target_dir = os.path.join(root, folder_name)
+    if digest == known_hash and os.path.isdir(target_dir):
+        return digest, False
+
+    tmp_dir = os.path.join(root, f"{UNZIP_TMP_PREFIX}{folder_name}.{os.getpid()}")
+    old_dir = tmp_dir + ".old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    try:
+        with ZipFile(path, "r") as zipObj:
+            zipObj.extractall(path=tmp_dir)
+        # Swap the new folder into place. The old folder is moved aside first, since a folder cannot be
+        # replaced by a rename while it still exists
+        moved_old = os.path.exists(target_dir)
+        if moved_old:
+            os.rename(target_dir, old_dir)
+        try:
+            os.rename(tmp_dir, target_dir)
+        except OSError:
+            # Put the previous install back, such that the bot keeps working
+            if moved_old:
+                os.rename(old_dir, target_dir)
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    # The new folder is in place, so the previous install can go
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return digest, True
+
+
+def file_hash(path: str) -> str:
+    """
+    Returns the sha256 hex digest of the content of the given file
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def load_unzip_record(ld: LeagueDir) -> Dict[str, str]:
+    """
+    Loads the mapping from zip files (relative to the bot directory) to the content hash they had when
+    they were last extracted
+    """
+    if not ld.unzip_record.exists():
+        return {}
+    with open(ld.unzip_record, 'r') as record_file:
+        return json.load(record_file)
+
+
+def save_unzip_record(ld: LeagueDir, record: Dict[str, str]):
+    with open(ld.unzip_record, 'w') as record_file:
+        json.dump(record, record_file, sort_keys=True, indent=4)
 
 
 def load_retired_bots(ld: LeagueDir) -> Set[BotID]:
@@ -0,0 +1,94 @@
+from pathlib import Path
+from typing import Dict, List
+
+from bots import BotID
+from match import MatchDetails, PlayerScore
+from match_stats import MatchStatsStore
+from paths import LeagueDir
+
+# The fields of a career record, in the order they are stored
+CAREER_FIELDS = ["games", "wins", "points", "goals", "shots", "saves", "assists", "demolitions", "own_goals"]
+
+
+class CareerStats(MatchStatsStore):
+    """
+    The career totals of each bot, i.e. games, wins, and the sums of their player scores, both in total and
+    split by map. Records are lists of numbers in the order of `CAREER_FIELDS`. The stats are saved in the
+    stats directory and updated once per match, so queries do not require reading all the matches.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.totals: Dict[BotID, List[int]] = {}
+        self.maps: Dict[BotID, Dict[str, List[int]]] = {}
+
+    def _add_match(self, match: MatchDetails, sign: int):
+        """
+        Add the scores of the given match to the stats. A sign of -1 removes the match again.
+        """
+        blue_won = match.result.blue_goals > match.result.orange_goals
+        orange_won = match.result.orange_goals > match.result.blue_goals
+        for team, won in [(match.blue, blue_won), (match.orange, orange_won)]:
+            for bot in team:
+                score = match.result.player_scores.get(bot, PlayerScore())
+                record = [
+                    1,
+                    int(won),
+                    score.points,
+                    score.goals,
+                    score.shots,
+                    score.saves,
+                    score.assists,
+                    score.demolitions,
+                    score.own_goals,
+                ]
+                self._add_record(self.totals, bot, record, sign)
+                self._add_record(self.maps.setdefault(bot, {}), match.map, record, sign)
+                if not self.maps[bot]:
+                    del self.maps[bot]
+
+    @staticmethod
+    def _add_record(records: Dict[str, List[int]], key: str, record: List[int], sign: int):
+        current = records.setdefault(key, [0] * len(CAREER_FIELDS))
+        for i, value in enumerate(record):
+            current[i] += sign * value
+        # Keep the stats compact when matches are removed
+        if current[0] == 0:
+            del records[key]
+
+    def career(self, bot: BotID) -> Dict[str, int]:
+        """
+        Returns the career totals of the given bot by field name
+        """
+        return dict(zip(CAREER_FIELDS, self.totals.get(bot, [0] * len(CAREER_FIELDS))))
+
+    def map_careers(self, bot: BotID) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the career totals of the given bot on each map it has played, most played first
+        """
+        records = sorted(self.maps.get(bot, {}).items(), key=lambda item: (-item[1][0], item[0]))
+        return {map_name: dict(zip(CAREER_FIELDS, record)) for map_name, record in records}
+
+    @staticmethod
+    def file(ld: LeagueDir) -> Path:
+        return ld.career_stats
+
+
+def print_career(stats: CareerStats, bot: BotID):
+    career = stats.career(bot)
+    games = career["games"]
+    if games == 0:
+        print(f"'{bot}' has not played any matches")
+        return
+
+    print(f"Career of {bot}:")
+    print(f"{'':<24} {'total':>7} {'per game':>9}")
+    print(f"{'games ':.<24} {games:>7}")
+    for name in CAREER_FIELDS[1:]:
+        print(f"{name + ' ':.<24} {career[name]:>7} {career[name] / games:>9.2f}")
+
+    print("Maps:")
+    print(f"{'':<24} {'games':>7} {'wins':>7} {'goals':>7} {'goals/game':>11}")
+    for map_name, record in stats.map_careers(bot).items():
+        print(f"{map_name + ' ':.<24} {record['games']:>7} {record['wins']:>7} {record['goals']:>7} "
+              f"{record['goals'] / record['games']:>11.2f}")
@@ -0,0 +1,70 @@
+import os
+from pathlib import Path
+from typing import Dict, Tuple, List, Callable, TypeVar
+
+from rlbot.config import load_match_config, load_player_config, load_player_loadout
+from rlbot.flat import MatchConfiguration, PlayerConfiguration, PsyonixBot
+from rlbot_flatbuffers import PsyonixSkill
+
+from bots import BotTomlConfig
+from paths import PackageFiles
+
+T = TypeVar("T")
+
+# Parsed configurations are stored as packed flatbuffers together with the modification times of the files
+# they were parsed from. Unpacking is much cheaper than parsing the toml files again, and it gives us a fresh
+# object every time, so templates are never modified by accident.
+_match_templates: Dict[str, Tuple[List[float], bytes]] = {}
+_player_templates: Dict[Tuple[str, int], Tuple[List[float], bytes]] = {}
+
+
+def mtimes(paths: List[Path]) -> List[float]:
+    """
+    Returns the modification times of the given files. Missing files have modification time 0.
+    """
+    return [os.path.getmtime(path) if os.path.exists(path) else 0.0 for path in paths]
+
+
+def _cached(cache: Dict, key, dependencies: List[Path], cls, load: Callable[[], T]) -> T:
+    times = mtimes(dependencies)
+    entry = cache.get(key)
+    if entry is None or entry[0] != times:
+        entry = (times, load().pack())
+        cache[key] = entry
+    return cls.unpack(entry[1])
+
+
+def match_config_template(path: Path = PackageFiles.default_match_config) -> MatchConfiguration:
+    """
+    Returns a copy of the match configuration in the given file. The file is only parsed again if it
+    has been modified since it was last parsed.
+    """
+    return _cached(_match_templates, str(path), [path], MatchConfiguration, lambda: load_match_config(path))
+
+
+def player_config(config: BotTomlConfig, team: int) -> PlayerConfiguration:
+    """
+    Returns a copy of the player configuration of the given bot on the given team. The bot's config files
+    are only parsed again if they have been modified since they were last parsed.
+    """
+    if (skill := config["settings"].get("psyonix_skill")) is not None:
+        # Psyonix bot
+        def load() -> PlayerConfiguration:
+            loadout = load_player_loadout(PackageFiles.psyonix_loadout, team)
+            return PlayerConfiguration(PsyonixBot(
+                name=config["settings"]["name"],
+                loadout=loadout,
+                bot_skill=PsyonixSkill(skill),
+            ), team)
+
+        dependencies = [Path(config["path"]), PackageFiles.psyonix_loadout]
+    else:
+        def load() -> PlayerConfiguration:
+            return load_player_config(config["path"], team)
+
+        dependencies = [Path(config["path"])]
+        loadout_file = config["settings"].get("loadout_file")
+        if loadout_file is not None:
+            dependencies.append(Path(config["path"]).parent / loadout_file)
+
+    return _cached(_player_templates, (str(config["path"]), team), dependencies, PlayerConfiguration, load)
@@ -1,32 +1,22 @@
 import csv
-
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from trueskill import Rating
 
-from bots import load_all_bots, load_retired_bots
+from bots import BotID, load_all_bots, load_retired_bots
 from leaguesettings import LeagueSettings
 from match import MatchDetails
 from match_maker import TicketSystem
-from paths import LeagueDir
+from npz_export import write_npz
+from paths import LeagueDir, history_time_stamp, history_sort_key
 from ranking_system import RankingSystem
 from settings import PersistentSettings
 
-
-def convert_to_csvs(ld: LeagueDir):
-
-    league_settings = LeagueSettings.load(ld)
-    RankingSystem.setup()
-
-    times = ["00000000000000"] + [path.name[:14] for path in list(ld.rankings.iterdir())]
-    rankings = RankingSystem.all(ld)
-    tickets = TicketSystem.all(ld, league_settings)
-    bots = sorted(rankings[-1].ratings.keys())
-    matches = MatchDetails.all(ld)
-
-    # Readme
-    with open(ld.csvs_readme, 'w', encoding='utf8') as readme:
-        readme.write("""# League Play Stats
+CSV_README = """# League Play Stats
 
 During league play various stats have been recorded.
 Among these csv files you will find MMR, tickets, points, goals, assists, saves, demolitions, own goals, which map were played on a more.
@@ -37,7 +27,8 @@ Feel free to mess around with it and generate some beautiful graphs.
 
 In this data set, the "match id" is the time stamp it was played.
 So whenever you see a time column, it represents both the time but also a particular match.
-The time stamp format is YYYYMMDDHHMMSS aka %Y%m%d%H%M%S.
+The time stamp format is YYYYMMDDHHMMSSffffff aka %Y%m%d%H%M%S%f (with microseconds).
+Matches played before the microseconds were added have time stamps of the format YYYYMMDDHHMMSS.
 
 ## Tables
 
@@ -103,122 +94,330 @@ Columns:
 - mmr
 - mu
 - sigma
-        """)
-
-    # Bots
-    with open(ld.csv_bots, 'w', newline="", encoding='utf8') as bots_csv:
-        bots_writer = csv.writer(bots_csv)
-        # Header
-        bots_writer.writerow(["bot", "status", "developer", "language", "description", "fun_fact", "github"])
-        bot_configs = load_all_bots(ld)
-        retirement = load_retired_bots(ld)
+
+## NumPy format
+
+The tables can also be generated as compressed NumPy files (`csvs generate --format npz`), e.g. `ratings.npz`.
+Each file contains an array per column with the same names as above. Time columns are `datetime64[us]`,
+and bot columns are indexes into the `bot_names` array of the file. Use `np.load` or `npz_export.load_table`.
+"""
+
+BOTS_HEADER = ["bot", "status", "developer", "language", "description", "fun_fact", "github"]
+TICKETS_HEADER = ["time", "bot", "count"]
+RATINGS_HEADER = ["time", "bot", "mmr", "mu", "sigma"]
+MATCHES_HEADER = [
+    "time",
+    "blue_bot_1",
+    "blue_bot_2",
+    "blue_bot_3",
+    "orange_bot_1",
+    "orange_bot_2",
+    "orange_bot_3",
+    "map",
+    "replay_id",
+    "blue_goals",
+    "orange_goals",
+]
+SCORES_HEADER = [
+    "time",
+    "bot",
+    "points",
+    "goals",
+    "shots",
+    "saves",
+    "assists",
+    "demolitions",
+    "own_goals",
+]
+
+
+# The tables made from the history. The bots table is always written from scratch, since the bots' status and
+# details can change.
+HISTORY_TABLES = ["tickets", "ratings", "matches", "scores"]
+TABLES = ["bots"] + HISTORY_TABLES
+
+
+class CsvWatermark:
+    """
+    Remembers how far the history has been exported to the csv files, such that an incremental export only
+    reads the newer history files and appends their rows. The object is saved as `watermark.json` in the
+    csvs directory.
+    """
+
+    def __init__(self):
+        # The last exported history file of each table, relative to its history directory
+        self.last_files: Dict[str, Optional[str]] = {table: None for table in HISTORY_TABLES}
+        # The last exported values of each bot. Only changes are exported.
+        self.last_mu: Dict[BotID, float] = {}
+        self.last_count: Dict[BotID, float] = {}
+
+    def new_files(self, table: str, directory: Path, history: List[Path]) -> Iterator[Path]:
+        """
+        Yields the files of the given history that are newer than the last file exported to the given table.
+        The last exported file is updated along the way.
+        """
+        last = self.last_files[table]
+        last_key = history_sort_key(directory / last) if last is not None else None
+        for path in history:
+            if last_key is None or history_sort_key(path) > last_key:
+                yield path
+                self.last_files[table] = path.relative_to(directory).as_posix()
+
+    def is_valid(self, ld: LeagueDir) -> bool:
+        """
+        Returns true if the csv files and the last exported history files still exist. Otherwise,
+        e.g. after a rollback, the csv files must be generated from scratch.
+        """
+        if set(self.last_files.keys()) != set(HISTORY_TABLES):
+            return False
+        return all(
+            table_csv(ld, table).exists() and (
+                self.last_files[table] is None or (history_dir(ld, table) / self.last_files[table]).exists())
+            for table in HISTORY_TABLES
+        )
+
+    def merge(self, table: str, other: 'CsvWatermark'):
+        """
+        Take the progress of the given table from a watermark that was updated by exporting that table
+        """
+        self.last_files[table] = other.last_files[table]
+        if table == "tickets":
+            self.last_count = other.last_count
+        elif table == "ratings":
+            self.last_mu = other.last_mu
+
+    def save(self, ld: LeagueDir):
+        with open(ld.csv_watermark, 'w') as f:
+            json.dump(self.__dict__, f, sort_keys=True)
+
+    @staticmethod
+    def load(ld: LeagueDir) -> Optional['CsvWatermark']:
+        if not ld.csv_watermark.exists():
+            return None
+        watermark = CsvWatermark()
+        with open(ld.csv_watermark) as f:
+            watermark.__dict__.update(json.load(f))
+        return watermark
+
+
+def table_csv(ld: LeagueDir, table: str) -> Path:
+    return {
+        "bots": ld.csv_bots,
+        "tickets": ld.csv_tickets,
+        "ratings": ld.csv_ratings,
+        "matches": ld.csv_matches,
+        "scores": ld.csv_scores,
+    }[table]
+
+
+def table_npz(ld: LeagueDir, table: str) -> Path:
+    return ld.csvs / f"{table}.npz"
+
+
+def history_dir(ld: LeagueDir, table: str) -> Path:
+    return {
+        "tickets": ld.tickets,
+        "ratings": ld.rankings,
+        "matches": ld.matches,
+        "scores": ld.matches,
+    }[table]
+
+
+def bot_rows(ld: LeagueDir, bots: List[BotID]) -> Iterator[list]:
+    bot_configs = load_all_bots(ld)
+    retirement = load_retired_bots(ld)
+    for bot in bots:
+        status = "retired" if bot in retirement else "active"
+        if bot in bot_configs:
+            details = bot_configs[bot].get("details", {})
+            yield [
+                bot,
+                status,
+                details.get("developer"),
+                details.get("language"),
+                details.get("description"),
+                details.get("fun_fact"),
+                details.get("github"),
+            ]
+        else:
+            yield [bot, status, "", "", "", "", ""]
+
+
+def ticket_rows(ld: LeagueDir, bots: List[BotID], settings: LeagueSettings,
+                watermark: CsvWatermark) -> Iterator[list]:
+    """
+    Yields a row for each change of a bot's tickets. Reads one tickets file at a time.
+    """
+    for path in watermark.new_files("tickets", ld.tickets, ld.history(ld.tickets)):
+        time_stamp = history_time_stamp(path)
+        ticket_sys = TicketSystem.read(path, settings)
+        default_tickets = 8.0 if 20210219110000 <= int(time_stamp[:14]) <= 20230122120000 else 4.0
         for bot in bots:
-            status = "retired" if bot in retirement else "active"
-            if bot in bot_configs:
-                config = bot_configs[bot]
-                bots_writer.writerow([
-                    bot,
-                    status,
-                    config.base_agent_config.get("Details", "developer"),
-                    config.base_agent_config.get("Details", "language"),
-                    config.base_agent_config.get("Details", "description"),
-                    config.base_agent_config.get("Details", "fun_fact"),
-                    config.base_agent_config.get("Details", "github")
-                ])
-            else:
-                bots_writer.writerow([bot, status, "", "", "", "", ""])
-
-    # Tickets
-    with open(ld.csv_tickets, 'w', newline="") as tickets_csv:
-        tickets_writer = csv.writer(tickets_csv)
-        # Header
-        tickets_writer.writerow(["time", "bot", "count"])
-        last_count = {}
-        z = zip(times, tickets)
-        next(z)
-        for time, ticket in z:
-            for bot in bots:
-                default_tickets = 8.0 if 20210219110000 <= int(time) <= 20230122120000 else 4.0
-                current_count = float(ticket.get_ensured(bot))
-                if (bot not in last_count and current_count != default_tickets) or (
-                        bot in last_count and current_count != last_count[bot]):
-                    tickets_writer.writerow([time, bot, current_count])
-                    last_count[bot] = current_count
-
-    # Rankings
-    with open(ld.csv_ratings, 'w', newline="") as ratings_csv:
-        ratings_writer = csv.writer(ratings_csv)
-        # Header
-        ratings_writer.writerow(["time", "bot", "mmr", "mu", "sigma"])
-        default_rating = Rating()
-        last_mu = {}
-        z = zip(times, rankings)
-        next(z)
-        for time, ranking in z:
-            for bot in bots:
-                current_mu = ranking.get(bot).mu
-                if (bot not in last_mu and current_mu != default_rating.mu) or (
-                        bot in last_mu and current_mu != last_mu[bot]):
-                    ratings_writer.writerow(
-                        [time, bot, ranking.get_mmr(bot), ranking.get(bot).mu, ranking.get(bot).sigma])
-                    last_mu[bot] = current_mu
-
-    # Matches
-    with open(ld.csv_matches, 'w', newline="") as matches_csv:
-        with open(ld.csv_scores, 'w', newline="") as scores_csv:
-            matches_writer = csv.writer(matches_csv)
-            scores_writer = csv.writer(scores_csv)
-            # Header
-            matches_writer.writerow([
-                "time",
-                "blue_bot_1",
-                "blue_bot_2",
-                "blue_bot_3",
-                "orange_bot_1",
-                "orange_bot_2",
-                "orange_bot_3",
-                "map",
-                "replay_id",
-                "blue_goals",
-                "orange_goals"
-            ])
-            scores_writer.writerow([
-                "time",
-                "bot",
-                "points",
-                "goals",
-                "shots",
-                "saves",
-                "assists",
-                "demolitions",
-                "own_goals",
-            ])
-            for match in matches:
-                matches_writer.writerow([
-                    match.time_stamp,
-                    match.blue[0],
-                    match.blue[1],
-                    match.blue[2],
-                    match.orange[0],
-                    match.orange[1],
-                    match.orange[2],
-                    match.map,
-                    match.replay_id,
-                    match.result.blue_goals,
-                    match.result.orange_goals,
-                ])
-                for bot, stats in match.result.player_scores.items():
-                    scores_writer.writerow([
-                        match.time_stamp,
-                        bot,
-                        stats.points,
-                        stats.goals,
-                        stats.shots,
-                        stats.saves,
-                        stats.assists,
-                        stats.demolitions,
-                        stats.own_goals,
-                    ])
+            current_count = float(ticket_sys.get_ensured(bot))
+            last_count = watermark.last_count.get(bot)
+            if (last_count is None and current_count != default_tickets) or (
+                    last_count is not None and current_count != last_count):
+                yield [time_stamp, bot, current_count]
+                watermark.last_count[bot] = current_count
+
+
+def rating_rows(ld: LeagueDir, bots: List[BotID], watermark: CsvWatermark) -> Iterator[list]:
+    """
+    Yields a row for each change of a bot's rating. Reads one rankings file at a time.
+    """
+    default_rating = Rating()
+    for path in watermark.new_files("ratings", ld.rankings, ld.history(ld.rankings)):
+        time_stamp = history_time_stamp(path)
+        ranking = RankingSystem.read(path)
+        for bot in bots:
+            rating = ranking.ratings.get(bot, default_rating)
+            last_mu = watermark.last_mu.get(bot)
+            if (last_mu is None and rating.mu != default_rating.mu) or (last_mu is not None and rating.mu != last_mu):
+                yield [time_stamp, bot, round(rating.mu - rating.sigma), rating.mu, rating.sigma]
+                watermark.last_mu[bot] = rating.mu
+
+
+def match_rows(ld: LeagueDir, watermark: CsvWatermark) -> Iterator[list]:
+    """
+    Yields a row for each match that has not been exported yet. Reads one match file at a time.
+    """
+    for path in watermark.new_files("matches", ld.matches, ld.history(ld.matches)):
+        match = MatchDetails.read(path)
+        yield [
+            match.time_stamp,
+            match.blue[0],
+            match.blue[1],
+            match.blue[2],
+            match.orange[0],
+            match.orange[1],
+            match.orange[2],
+            match.map,
+            match.replay_id,
+            match.result.blue_goals,
+            match.result.orange_goals,
+        ]
+
+
+def score_rows(ld: LeagueDir, watermark: CsvWatermark) -> Iterator[list]:
+    """
+    Yields a row for each bot in each match that has not been exported yet. Reads one match file at a time.
+    """
+    for path in watermark.new_files("scores", ld.matches, ld.history(ld.matches)):
+        match = MatchDetails.read(path)
+        for bot, stats in match.result.player_scores.items():
+            yield [
+                match.time_stamp,
+                bot,
+                stats.points,
+                stats.goals,
+                stats.shots,
+                stats.saves,
+                stats.assists,
+                stats.demolitions,
+                stats.own_goals,
+            ]
+
+
+def write_csv(path: Path, header: List[str], rows: Iterator[list], append: bool) -> int:
+    """
+    Write the rows to the given csv file. The header is only written to new files.
+    Returns the number of rows written.
+    """
+    count = 0
+    with open(path, 'a' if append else 'w', newline="", encoding='utf8') as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export_table(ld: LeagueDir, table: str, bots: List[BotID], settings: LeagueSettings, watermark: CsvWatermark,
+                 append: bool, fmt: str = "csv") -> Tuple[str, int, float, CsvWatermark]:
+    """
+    Write one of the tables in the given format ("csv" or "npz"). Returns the table, the number of rows written,
+    the time it took, and the watermark updated with the progress of the table. Tables can be exported in
+    separate processes.
+    """
+    start = time.perf_counter()
+    RankingSystem.setup()
+    if table == "bots":
+        header, rows = BOTS_HEADER, bot_rows(ld, bots)
+        append = False
+    elif table == "tickets":
+        header, rows = TICKETS_HEADER, ticket_rows(ld, bots, settings, watermark)
+    elif table == "ratings":
+        header, rows = RATINGS_HEADER, rating_rows(ld, bots, watermark)
+    elif table == "matches":
+        header, rows = MATCHES_HEADER, match_rows(ld, watermark)
+    else:
+        header, rows = SCORES_HEADER, score_rows(ld, watermark)
+    if fmt == "npz":
+        count = write_npz(table_npz(ld, table), table, rows, bots)
+    else:
+        count = write_csv(table_csv(ld, table), header, rows, append)
+    return table, count, time.perf_counter() - start, watermark
+
+
+def convert_to_csvs(ld: LeagueDir, incremental: bool = False, parallel: bool = False, fmt: str = "csv") -> int:
+    """
+    Export the league history to csv files. The history is streamed one file at a time, so memory use does
+    not grow with the length of the history. If `incremental` is true, only the rows of the history files added
+    since the last export are appended to the csv files. If `parallel` is true, the tables are exported
+    simultaneously by a pool of processes. If `fmt` is "npz", the tables are written as compressed NumPy files
+    instead. Returns the number of exported matches.
+    """
+    league_settings = LeagueSettings.load(ld)
+    RankingSystem.setup()
+
+    if fmt == "npz" and incremental:
+        # Compressed npz files cannot be appended to
+        print("The npz files are always generated from scratch.")
+        incremental = False
+
+    watermark = CsvWatermark.load(ld) if incremental else None
+    if incremental and (watermark is None or not watermark.is_valid(ld)):
+        print("The csv files are missing or out of date. Generating them from scratch.")
+        watermark = None
+    append = watermark is not None
+    watermark = watermark or CsvWatermark()
+
+    bots = sorted(RankingSystem.load(ld).ratings.keys())
+
+    # Readme
+    with open(ld.csvs_readme, 'w', encoding='utf8') as readme:
+        readme.write(CSV_README)
+
+    start = time.perf_counter()
+    match_count = 0
+
+    def report(table: str, rows: int, elapsed: float, table_watermark: CsvWatermark):
+        nonlocal match_count
+        if table in HISTORY_TABLES:
+            watermark.merge(table, table_watermark)
+        if table == "matches":
+            match_count = rows
+        print(f"{table + '.' + fmt + ' ':.<16} {rows:>8} rows  {elapsed:>6.2f} s")
+
+    if parallel:
+        with ProcessPoolExecutor(max_workers=len(TABLES)) as executor:
+            futures = [
+                executor.submit(export_table, ld, table, bots, league_settings, watermark, append, fmt)
+                for table in TABLES
+            ]
+            for future in as_completed(futures):
+                report(*future.result())
+    else:
+        for table in TABLES:
+            report(*export_table(ld, table, bots, league_settings, watermark, append, fmt))
+
+    print(f"Exported in {time.perf_counter() - start:.2f} s")
+    if fmt == "csv":
+        # The watermark only tracks the csv files
+        watermark.save(ld)
+    return match_count
 
 
 if __name__ == '__main__':
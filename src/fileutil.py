@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+
+def write_text_atomic(path: Path, text: str, skip_unchanged: bool = False) -> bool:
+    """
+    Write text to the given file by writing to a temporary file and renaming it into place. Readers will
+    therefore see either the old or the new content, never a partially written file. If `skip_unchanged`
+    is true, the file is not touched when it already has the given content. Returns whether the file was written.
+    """
+    path = Path(path)
+    if skip_unchanged and path.exists():
+        with open(path, 'r', encoding='utf8') as f:
+            if f.read() == text:
+                return False
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf8') as f:
+        f.write(text)
+
+    # On Windows the rename fails if a reader has the file open at this exact moment, so we retry a few times
+    for attempt in range(10):
+        try:
+            os.replace(tmp_path, path)
+            return True
+        except PermissionError:
+            if attempt == 9:
+                os.remove(tmp_path)
+                raise
+            time.sleep(0.01)
+    return True
+
+
+def write_json_atomic(path: Path, obj: Any, skip_unchanged: bool = False, **kwargs) -> bool:
+    """
+    Serialize the given object as json and write it to the given file atomically. See `write_text_atomic`.
+    Additional keyword arguments are passed to `json.dumps`.
+    """
+    return write_text_atomic(path, json.dumps(obj, **kwargs), skip_unchanged)
+
+
+@contextmanager
+def file_lock(path: Path, stale_after: float = 60.0):
+    """
+    Hold an exclusive lock shared by all processes that use the given lock file. The lock is taken by creating the
+    file exclusively, which works on all platforms, and waits while another process holds it. A lock file older
+    than `stale_after` seconds is assumed to be left by a crashed process and is taken over.
+    """
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_after:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                # Released in the meantime
+                continue
+            time.sleep(0.01)
+    try:
+        os.write(fd, str(os.getpid()).encode('ascii'))
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
@@ -21,6 +21,27 @@ class LeagueSettings:
         self.ticket_increase_rate = 1.5
         self.game_catchup_boost = 0.75
 
+        # The backend used to play matches. "rlbot" plays them in the game, "simulated" simulates them.
+        self.match_backend = "rlbot"
+
+        # Mercy rule. A match ends early when a team leads by at least `mercy_goal_difference` goals and at most
+        # `mercy_time_remaining` seconds remain. A goal difference of 0 disables the mercy rule.
+        self.mercy_goal_difference = 0
+        self.mercy_time_remaining = 120.0
+
+        # Number of times per second the game state is recorded to the match's telemetry file. 0 disables recording.
+        self.telemetry_rate = 0.0
+
+        # Number of times per second the live match state for overlays is published. 0 disables the live feed.
+        self.live_feed_rate = 4.0
+
+        # Maximum number of times per second the TMCP overlay script writes its data file. Must be greater than 0.
+        self.tmcp_write_rate = 10.0
+
+        # Seconds between samples of the bots' CPU and memory usage during matches. 0 disables monitoring.
+        # Monitoring requires /proc and is therefore only available on Linux.
+        self.resource_monitor_interval = 1.0
+
     def save(self, ld: LeagueDir):
         with open(ld.league_settings, 'w') as f:
             json.dump(self.__dict__, f, sort_keys=True, indent=4)
@@ -3,12 +3,16 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Mapping, List, Dict, Optional
 
-from rlbot.config import load_match_config, load_player_config, load_player_loadout
-from rlbot.flat import MatchConfiguration, PlayerConfiguration, PsyonixBot
-from rlbot_flatbuffers import PsyonixSkill
+from rlbot.flat import MatchConfiguration, PlayerConfiguration
 
 from bots import BotID, BotTomlConfig
-from paths import PackageFiles, LeagueDir
+from config_cache import match_config_template, player_config
+from paths import LeagueDir, history_time_stamp
+from process_monitor import ResourceUsage
+
+
+# Length of a standard match in seconds, not counting overtime
+MATCH_LENGTH = 300.0
 
 
 class Team:
@@ -39,6 +43,14 @@ class MatchResult:
     blue_goals: int = 0
     orange_goals: int = 0
     player_scores: Dict[BotID, PlayerScore] = field(default_factory=dict)
+    mercy: bool = False  # Whether the match was ended early by the mercy rule
+    time_remaining: float = 0.0  # Seconds of game time left when the match ended
+
+    def played_fraction(self) -> float:
+        """
+        Returns the fraction of the regular match length that was played
+        """
+        return min(1.0, max(0.0, 1.0 - self.time_remaining / MATCH_LENGTH))
 
 
 @dataclass
@@ -50,9 +62,11 @@ class MatchDetails:
     map: str = ""
     result: Optional[MatchResult] = None
     replay_id: Optional[str] = None
+    telemetry: Optional[str] = None  # Name of the telemetry file in the telemetry directory
+    resource_usage: Dict[BotID, ResourceUsage] = field(default_factory=dict)
 
     def to_config(self, bots: Mapping[BotID, BotTomlConfig]) -> MatchConfiguration:
-        match_config = load_match_config(PackageFiles.default_match_config)
+        match_config = match_config_template()
         match_config.game_map_upk = self.map
         match_config.player_configurations = [
             self.bot_to_config(bots[self.blue[0]], Team.BLUE),
@@ -65,20 +79,17 @@ class MatchDetails:
         return match_config
 
     def bot_to_config(self, config: BotTomlConfig, team: int) -> PlayerConfiguration:
-        if (skill := config["settings"].get("psyonix_skill")) is not None:
-            # Psyonix bot
-            loadout = load_player_loadout(PackageFiles.psyonix_loadout, team)
-            pcfg = PlayerConfiguration(PsyonixBot(
-                name=config["settings"]["name"],
-                loadout=loadout,
-                bot_skill=PsyonixSkill(skill),
-            ), team)
-        else:
-            pcfg = load_player_config(config["path"], team)
-        return pcfg
+        return player_config(config, team)
+
+    def restamp(self, time_stamp: str):
+        """
+        Give the match a new time stamp. The name, which starts with the time stamp, is updated too.
+        """
+        self.name = time_stamp + self.name[len(self.time_stamp):]
+        self.time_stamp = time_stamp
 
     def save(self, ld: LeagueDir):
-        self.write(ld.matches / f"{self.name}.json")
+        self.write(ld.history_file(ld.matches, self.time_stamp, f"{self.name}.json"))
 
     def write(self, path: Path):
         """
@@ -92,26 +103,22 @@ class MatchDetails:
         """
         Returns the match details of the n latest matches
         """
-        # Assume last match file is the newest, since they are prefixed with a time stamp
-        return [MatchDetails.read(path) for path in list(ld.matches.iterdir())[-count:]]
+        return [MatchDetails.read(path) for path in ld.history(ld.matches, count)]
 
     @staticmethod
-    def all(ld: LeagueDir) -> List['MatchDetails']:
+    def latest_time_stamp(ld: LeagueDir) -> Optional[str]:
         """
-        Returns a list of all matches played, chronological order
+        Returns the time stamp of the latest match or None if no matches have been played
         """
-        return [MatchDetails.read(path) for path in list(ld.matches.iterdir())]
+        latest = ld.history(ld.matches, 1)
+        return history_time_stamp(latest[0]) if latest else None
 
     @staticmethod
-    def undo(ld: LeagueDir):
+    def all(ld: LeagueDir) -> List['MatchDetails']:
         """
-        Remove latest match
+        Returns a list of all matches played, chronological order
         """
-        if any(ld.matches.iterdir()):
-            # Assume last match file is the newest, since they are prefixed with a time stamp
-            list(ld.matches.iterdir())[-1].unlink()   # Remove file
-        else:
-            print("No match to undo.")
+        return [MatchDetails.read(path) for path in ld.history(ld.matches)]
 
     @staticmethod
     def read(path: Path) -> 'MatchDetails':
@@ -128,6 +135,7 @@ known_types = {
     MatchDetails: "__MatchDetails__",
     MatchResult: "__MatchResult__",
     PlayerScore: "__PlayerScore__",
+    ResourceUsage: "__ResourceUsage__",
 }
 
 
@@ -151,6 +159,7 @@ def as_match_details(json_obj) -> MatchDetails:
             continue
         obj = cls()
         del json_obj[tag]
-        obj.__dict__ = json_obj
+        # Fields missing in older files keep their default value
+        obj.__dict__.update(json_obj)
         return obj
     return json_obj
@@ -0,0 +1,143 @@
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Mapping, List
+
+from bots import BotID, BotTomlConfig
+from career_stats import CareerStats
+from fileutil import file_lock
+from leaguesettings import LeagueSettings
+from match import MatchDetails, MatchResult
+from match_index import MatchIndex
+from match_maker import TicketSystem, make_timestamp
+from overlay import update_summary, SummaryState
+from paths import LeagueDir, TIME_STAMP_LENGTH
+from ranking_system import RankingSystem
+from rating_trajectory import truncate_ratings
+from replays import ReplayData
+from synergy import SynergyStats
+from telemetry import pending_telemetry_path
+
+
+def commit_match(ld: LeagueDir, match: MatchDetails, result: MatchResult, replay: Optional[ReplayData],
+                 rank_sys: RankingSystem, ticket_sys: TicketSystem, bots: Mapping[BotID, BotTomlConfig]):
+    """
+    Make a finished match part of the league. That is, update ranks, save the replay, save the match and the
+    new states of the ranking and ticket systems, and update the summary. The ticket system must be the
+    one that was used to make the match.
+    """
+    match.result = result
+
+    # Update ranks
+    rank_sys.update(match, result)
+
+    # Save replay
+    if replay is None:
+        print(f"WARNING: No replay was found for the match '{match.name}'.")
+    else:
+        match.replay_id = replay.replay_id
+
+        try:
+            dst = ld.replays / f"{replay.replay_id}.replay"
+            shutil.copy(replay.replay_path, dst)
+            print("Replay successfully copied to replays directory")
+        except:
+            print("WARNING: Fail to copy replay to replays directory.")
+
+        # if replay_preference == ReplayPreference.CALCULATED_GG:
+        #     upload_to_calculated_gg(replay.replay_path)
+
+    # The telemetry is recorded to a temporary file, which becomes part of the league with the match
+    if match.telemetry is not None:
+        telemetry_path = ld.telemetry / match.telemetry
+        pending_path = pending_telemetry_path(telemetry_path)
+        if pending_path.exists():
+            os.replace(pending_path, telemetry_path)
+
+    with file_lock(ld.history_lock):
+        # Time stamps are only unique within a process. If another process has written history files with the
+        # same or a later time stamp since the match was made, the match gets a new time stamp.
+        latest = ld.latest_time_stamp()
+        if latest is not None and latest.ljust(TIME_STAMP_LENGTH, "0") >= match.time_stamp.ljust(TIME_STAMP_LENGTH, "0"):
+            match.restamp(make_timestamp(after=latest))
+
+        # Save
+        synergy = SynergyStats.load(ld)
+        career = CareerStats.load(ld)
+        index = MatchIndex.load(ld)
+        match.save(ld)
+        rank_sys.save(ld, match.time_stamp)
+        ticket_sys.save(ld, match.time_stamp)
+        synergy.add_match(match)
+        synergy.save(ld)
+        career.add_match(match)
+        career.save(ld)
+        index.add_match(match)
+        index.save(ld)
+        index.close()
+
+        # Make summary
+        update_summary(ld, match, rank_sys, ticket_sys, bots)
+
+
+@dataclass
+class RollbackPlan:
+    """
+    The history files that must be removed to restore the league to the state just before a match
+    """
+    match: MatchDetails
+    matches: List[Path] = field(default_factory=list)
+    snapshots: List[Path] = field(default_factory=list)  # Rankings and tickets files
+    index_offset: int = 0
+
+
+def plan_rollback(ld: LeagueDir, match_id: str) -> Optional[RollbackPlan]:
+    """
+    Find the files written since the given match was played (including its own) using the history index.
+    The match id is the match's time stamp or name. Returns None if there is no such match.
+    """
+    entries = ld.read_history_index()
+    for i, (offset, entry) in enumerate(entries):
+        path = ld.history_index.parent / entry["path"]
+        if entry["kind"] == "matches" and match_id in (entry["time_stamp"], path.stem) and path.exists():
+            plan = RollbackPlan(MatchDetails.read(path), index_offset=offset)
+            for _, later in entries[i:]:
+                later_path = ld.history_index.parent / later["path"]
+                if later_path.exists():
+                    (plan.matches if later["kind"] == "matches" else plan.snapshots).append(later_path)
+            return plan
+    return None
+
+
+def rollback(ld: LeagueDir, plan: RollbackPlan):
+    """
+    Remove the files of the rollback plan, such that the rankings and tickets are as they were before the match
+    """
+    with file_lock(ld.history_lock):
+        synergy = SynergyStats.load(ld)
+        career = CareerStats.load(ld)
+        index = MatchIndex.load(ld)
+        bots = set()
+        for path in plan.matches:
+            match = MatchDetails.read(path)
+            if match.telemetry is not None:
+                (ld.telemetry / match.telemetry).unlink(missing_ok=True)
+            synergy.remove_match(match)
+            career.remove_match(match)
+            index.remove_match(match)
+            bots.update(match.blue + match.orange)
+            ld.remove_history_file(path)
+        for path in plan.snapshots:
+            ld.remove_history_file(path)
+        ld.truncate_history_index(plan.index_offset)
+        truncate_ratings(ld, bots, plan.match.time_stamp)
+        synergy.save(ld)
+        career.save(ld)
+        index.save(ld)
+        index.close()
+        # The removed matches are no longer part of the session summary
+        settings = LeagueSettings.load(ld)
+        settings.last_summary = max(0, settings.last_summary - len(plan.matches))
+        settings.save(ld)
+        SummaryState.invalidate(ld)
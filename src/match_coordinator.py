@@ -0,0 +1,276 @@
+import base64
+import copy
+import json
+import multiprocessing
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Optional, Set, List
+
+from bots import BotID, load_all_bots, load_all_unretired_bots
+from match import MatchDetails, MatchDetailsEncoder, as_match_details
+from match_commit import commit_match
+from match_maker import TicketSystem, MatchMaker, make_timestamp
+from match_runner import MatchBackend, get_backend
+from paths import LeagueDir
+from ranking_system import RankingSystem
+from replays import ReplayData
+from telemetry import pending_telemetry_path
+
+DEFAULT_PORT = 8766
+
+# The coordinator and the workers exchange json messages, one per line:
+#   worker -> coordinator: {"type": "ready"}
+#   coordinator -> worker: {"type": "match", "match": <MatchDetails>}  or  {"type": "stop"}
+#   worker -> coordinator: {"type": "result", "match": <MatchDetails with result>, "replay": {"id", "data"} or null,
+#                           "telemetry": <data> or null}
+# After a result, the coordinator replies with the next match or stop. The replay and telemetry files are sent as
+# base64 data, since workers may run on other machines with their own league directory.
+
+
+def encode_file(path: Path) -> str:
+    return base64.b64encode(path.read_bytes()).decode('ascii')
+
+
+def decode_file(path: Path, data: str):
+    path.write_bytes(base64.b64decode(data))
+
+
+def send_message(stream, message: dict):
+    stream.write(json.dumps(message, cls=MatchDetailsEncoder) + "\n")
+    stream.flush()
+
+
+def receive_message(stream) -> Optional[dict]:
+    """
+    Returns the next message from the stream or None if the connection was closed
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line, object_hook=as_match_details)
+
+
+class MatchCoordinator:
+    """
+    Plays a number of matches in parallel by handing them out to workers connected over a socket. Each worker
+    drives its own game instance (see `run_worker`). The coordinator owns the ranking and ticket systems. A match
+    is only made when a worker is ready for it, and the matchmaking only considers bots that are not playing
+    already, so no bot plays two matches at once. Results are committed in the order the matches finish, and the
+    tickets of a match's bots are only used up when it is committed. If a worker disconnects during a match, the
+    match is dropped and handed out again as a new match. The coordinator stops once all matches are committed,
+    or when no match can be made or played anymore.
+    """
+
+    def __init__(self, ld: LeagueDir, count: int, host: str = "localhost", port: int = DEFAULT_PORT):
+        self.ld = ld
+        self.count = count
+        self.bots = load_all_unretired_bots(ld)
+        self.rank_sys = RankingSystem.load(ld)
+        self.ticket_sys = TicketSystem.load(ld)
+        self.handed_out = 0
+        self.committed = 0
+        self.busy: Set[BotID] = set()
+        self.workers = 0
+        self._stopping = False
+        self._cond = threading.Condition()
+
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                coordinator._serve_worker(self.request.makefile('rw', encoding='utf8'), self.client_address)
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    def run(self):
+        """
+        Serve workers until all matches are committed
+        """
+        host, port = self.address
+        print(f"Coordinating {self.count} matches on {host}:{port}. Waiting for workers...")
+        if self.count > 0:
+            self._server.serve_forever()
+        self._server.server_close()
+        print(f"Committed {self.committed} matches")
+
+    def stop(self):
+        """
+        Stop serving workers. Must be called with the lock held.
+        """
+        if not self._stopping:
+            self._stopping = True
+            # Stops serve_forever in the main thread
+            threading.Thread(target=self._server.shutdown).start()
+
+    def next_match(self) -> Optional[MatchDetails]:
+        """
+        Make the next match among the bots that are not playing. Waits until enough bots are free.
+        Returns None when no more matches should be played.
+        """
+        with self._cond:
+            while True:
+                if self.committed >= self.count:
+                    return None
+                if self.handed_out < self.count:
+                    free = {bot_id: config for bot_id, config in self.bots.items() if bot_id not in self.busy}
+                    if len(free) >= 6:
+                        break
+                    if not self.busy:
+                        print("Not enough bots to make a match")
+                        self.stop()
+                        return None
+                # Wait for a match to finish or be dropped
+                self._cond.wait()
+
+            # The match is made with a copy of the ticket system, since the match may be dropped. The tickets are
+            # used up in `finish_match`.
+            match = MatchMaker.make_next(free, self.rank_sys, copy.deepcopy(self.ticket_sys))
+            self.busy.update(match.blue + match.orange)
+            self.handed_out += 1
+            return match
+
+    def finish_match(self, match: MatchDetails, replay: Optional[ReplayData]):
+        """
+        Commit a finished match. The match gets a new time stamp such that the history stays in commit order.
+        """
+        with self._cond:
+            self.busy.difference_update(match.blue + match.orange)
+            # Like in a serial run, the tickets of bots that are playing other matches are left alone
+            free = [bot_id for bot_id in self.bots if bot_id not in self.busy]
+            self.ticket_sys.ensure(free)
+            self.ticket_sys.choose(match.blue + match.orange, free)
+            match.restamp(make_timestamp())
+            commit_match(self.ld, match, match.result, replay, self.rank_sys, self.ticket_sys, self.bots)
+            self.committed += 1
+            print(f"Committed {match.name} ({self.committed}/{self.count})")
+            done = self.committed >= self.count
+            self._cond.notify_all()
+        if done:
+            self.rank_sys.print_ranks_and_mmr()
+            with self._cond:
+                self.stop()
+
+    def drop_match(self, match: MatchDetails):
+        """
+        Forget a match that was handed out but will never finish
+        """
+        with self._cond:
+            self.busy.difference_update(match.blue + match.orange)
+            self.handed_out -= 1
+            self._cond.notify_all()
+
+    def _serve_worker(self, stream, address):
+        message = receive_message(stream)
+        if message is None or message.get("type") != "ready":
+            return
+        print(f"Worker {address[0]}:{address[1]} connected")
+        with self._cond:
+            self.workers += 1
+        try:
+            self._serve_matches(stream, address)
+        finally:
+            with self._cond:
+                self.workers -= 1
+                if self.workers == 0 and not self.busy and not self._stopping:
+                    print("WARNING: All workers disconnected")
+                    self.stop()
+
+    def _serve_matches(self, stream, address):
+        while True:
+            match = self.next_match()
+            if match is None:
+                send_message(stream, {"type": "stop"})
+                return
+            try:
+                send_message(stream, {"type": "match", "match": match})
+                message = receive_message(stream)
+            except OSError:
+                message = None
+            if message is None or message.get("type") != "result":
+                print(f"WARNING: Worker {address[0]}:{address[1]} disconnected during match {match.name}")
+                self.drop_match(match)
+                return
+
+            played: MatchDetails = message["match"]
+            match.result = played.result
+            match.resource_usage = played.resource_usage
+            if played.telemetry is not None and message.get("telemetry") is not None:
+                # Stored under the pending name, which `commit_match` renames into place
+                match.telemetry = Path(played.telemetry).name
+                decode_file(pending_telemetry_path(self.ld.telemetry / match.telemetry), message["telemetry"])
+            replay = None
+            if message.get("replay") is not None:
+                # A temporary copy of the worker's replay, which `commit_match` copies to the replays directory
+                replay_id = Path(message["replay"]["id"]).name
+                replay = ReplayData(self.ld.replays / f".{replay_id}.replay.tmp", replay_id)
+                decode_file(replay.replay_path, message["replay"]["data"])
+            try:
+                self.finish_match(match, replay)
+            finally:
+                if replay is not None:
+                    replay.replay_path.unlink(missing_ok=True)
+
+
+def run_worker(ld: LeagueDir, backend: MatchBackend, host: str = "localhost", port: int = DEFAULT_PORT):
+    """
+    Connect to a coordinator and play the matches it hands out using the given backend until it says stop
+    """
+    bots = load_all_bots(ld)
+    with socket.create_connection((host, port)) as sock, sock.makefile('rw', encoding='utf8') as stream:
+        send_message(stream, {"type": "ready"})
+        while True:
+            message = receive_message(stream)
+            if message is None or message["type"] == "stop":
+                break
+            match: MatchDetails = message["match"]
+            result, replay = backend.run(ld, match, bots, get_replay_data=True)
+            match.result = result
+            telemetry = None
+            if match.telemetry is not None:
+                # The coordinator commits the match, so the worker's pending telemetry file is sent and removed.
+                # It is removed even if sending fails, since the coordinator then drops the match.
+                pending_path = pending_telemetry_path(ld.telemetry / match.telemetry)
+                if pending_path.exists():
+                    telemetry = encode_file(pending_path)
+                    pending_path.unlink()
+            send_message(stream, {
+                "type": "result",
+                "match": match,
+                "replay": {"id": replay.replay_id, "data": encode_file(replay.replay_path)} if replay else None,
+                "telemetry": telemetry,
+            })
+
+
+def _run_local_worker(ld: LeagueDir, backend_name: str, host: str, port: int):
+    run_worker(ld, get_backend(backend_name), host, port)
+
+
+def run_local(ld: LeagueDir, count: int, workers: int, backend_name: str = "simulated"):
+    """
+    Play matches in parallel using a coordinator and the given number of local worker processes
+    """
+    coordinator = MatchCoordinator(ld, count, port=0)
+    host, port = coordinator.address
+    processes: List[multiprocessing.Process] = [
+        multiprocessing.Process(target=_run_local_worker, args=(ld, backend_name, host, port))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        coordinator.run()
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
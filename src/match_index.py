@@ -0,0 +1,164 @@
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional
+
+from bots import BotID
+from match import MatchDetails
+from paths import LeagueDir, TIME_STAMP_LENGTH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    key TEXT PRIMARY KEY,  -- The time stamp padded to TIME_STAMP_LENGTH, such that keys sort chronologically
+    time_stamp TEXT NOT NULL,
+    blue TEXT NOT NULL,  -- json list of bot ids
+    orange TEXT NOT NULL,
+    map TEXT,
+    blue_goals INTEGER NOT NULL,
+    orange_goals INTEGER NOT NULL,
+    margin INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS match_bots (
+    bot TEXT NOT NULL,
+    key TEXT NOT NULL REFERENCES matches(key) ON DELETE CASCADE,
+    PRIMARY KEY (bot, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS matches_by_map ON matches(map, key);
+CREATE INDEX IF NOT EXISTS match_bots_by_key ON match_bots(key);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def match_key(time_stamp: str) -> str:
+    return time_stamp.ljust(TIME_STAMP_LENGTH, "0")
+
+
+@dataclass
+class MatchFilter:
+    """
+    Which matches to list. All given conditions must hold. Dates are YYYYMMDD and inclusive.
+    """
+    bots: List[BotID] = field(default_factory=list)
+    map: Optional[str] = None  # The UPK name of the map
+    since: Optional[str] = None
+    until: Optional[str] = None
+    min_margin: int = 0
+
+
+@dataclass
+class MatchRow:
+    time_stamp: str
+    blue: List[BotID]
+    orange: List[BotID]
+    map: str
+    blue_goals: int
+    orange_goals: int
+
+
+class MatchIndex:
+    """
+    An sqlite index of the match history with the teams, map, and score of each match. It is indexed by
+    bot, map, and time, so listing a filtered page of matches only touches the matching rows and no match files.
+    Like the other stats, the index is updated once per match and rebuilt if it is out of date.
+    """
+
+    def __init__(self, ld: LeagueDir):
+        self._conn = sqlite3.connect(ld.match_index)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def last_match(self) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = 'last_match'").fetchone()
+        return row[0] if row else None
+
+    def add_match(self, match: MatchDetails):
+        key = match_key(match.time_stamp)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, match.time_stamp, json.dumps(match.blue), json.dumps(match.orange), match.map,
+             match.result.blue_goals, match.result.orange_goals,
+             abs(match.result.blue_goals - match.result.orange_goals))
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO match_bots VALUES (?, ?)",
+            [(bot, key) for bot in match.blue + match.orange]
+        )
+
+    def remove_match(self, match: MatchDetails):
+        self._conn.execute("DELETE FROM matches WHERE key = ?", (match_key(match.time_stamp),))
+
+    def save(self, ld: LeagueDir):
+        """
+        Commit the changes. The index must include exactly the matches currently in the history.
+        """
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_match', ?)",
+                           (MatchDetails.latest_time_stamp(ld),))
+        self._conn.commit()
+
+    def query(self, match_filter: MatchFilter, limit: Optional[int] = None, offset: int = 0,
+              newest_first: bool = False) -> Iterator[MatchRow]:
+        """
+        Yields the matches satisfying the filter in chronological order (or newest first). The rows are
+        read lazily, so the first rows are available before the query is done.
+        """
+        conditions = []
+        params = []
+        for bot in match_filter.bots:
+            conditions.append("key IN (SELECT key FROM match_bots WHERE bot = ?)")
+            params.append(bot)
+        if match_filter.map is not None:
+            conditions.append("map = ?")
+            params.append(match_filter.map)
+        if match_filter.since is not None:
+            conditions.append("key >= ?")
+            params.append(match_key(match_filter.since))
+        if match_filter.until is not None:
+            # The until date is inclusive, so the keys must be less than the next day's keys, which are
+            # less than the until date followed by any character greater than the digits
+            conditions.append("key < ?")
+            params.append(match_filter.until + ":")
+        if match_filter.min_margin > 0:
+            conditions.append("margin >= ?")
+            params.append(match_filter.min_margin)
+
+        sql = "SELECT time_stamp, blue, orange, map, blue_goals, orange_goals FROM matches"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY key DESC" if newest_first else " ORDER BY key"
+        if limit is not None or offset > 0:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit if limit is not None else -1, offset]
+
+        for time_stamp, blue, orange, map_name, blue_goals, orange_goals in self._conn.execute(sql, params):
+            yield MatchRow(time_stamp, json.loads(blue), json.loads(orange), map_name, blue_goals, orange_goals)
+
+    @staticmethod
+    def build(ld: LeagueDir) -> 'MatchIndex':
+        """
+        Build the index from the match history
+        """
+        ld.match_index.unlink(missing_ok=True)
+        index = MatchIndex(ld)
+        for path in ld.history(ld.matches):
+            index.add_match(MatchDetails.read(path))
+        index.save(ld)
+        return index
+
+    @staticmethod
+    def load(ld: LeagueDir) -> 'MatchIndex':
+        """
+        Open the index. It is built from the match history if it is missing or out of date.
+        """
+        if ld.match_index.exists():
+            index = MatchIndex(ld)
+            if index.last_match == MatchDetails.latest_time_stamp(ld):
+                return index
+            index.close()
+        return MatchIndex.build(ld)
@@ -1,6 +1,6 @@
 import json
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from random import shuffle, choice
 from typing import Dict, List, Iterable, Mapping, Tuple, Optional
 
@@ -15,7 +15,7 @@ from rlbot.utils.maps import GAME_MAP_TO_UPK
 from bots import BotID, fmt_bot_name, BotTomlConfig
 from leaguesettings import LeagueSettings
 from match import MatchDetails
-from paths import LeagueDir, PackageFiles
+from paths import LeagueDir, PackageFiles, TIME_STAMP_LENGTH
 from ranking_system import RankingSystem
 from trueskill import Rating
 
@@ -29,6 +29,12 @@ class TicketSystem:
         self.new_bot_ticket_count = 4.0
         self.session_game_counts: Dict[BotID, int] = {}
 
+        # Number of matches included in the session game counts and the time stamps of the first and the latest of
+        # them. These are saved with the tickets, so the counts do not have to be recounted from the matches.
+        self.session_matches = 0
+        self.session_start: Optional[str] = None
+        self.session_end: Optional[str] = None
+
         # Decrease this number toward 1.0 if you want to prioritize a balanced number of games played.
         # Increase it if you want more randomness, and priority for bots who haven't played recently.
         self.ticket_increase_rate = 1.2
@@ -95,6 +101,7 @@ class TicketSystem:
         Choose the list of given bots, which will reset their number of tickets and double every else's.
         """
         max_game_count = max(self.session_game_counts.values())
+        self.session_matches += 1
         for bot in all_bots:
             if bot in chosen_bots:
                 # Reset their tickets
@@ -110,59 +117,81 @@ class TicketSystem:
                 self.tickets[bot] *= (self.ticket_increase_rate + games_deficit * self.game_catchup_boost)
 
     def save(self, ld: LeagueDir, time_stamp: str):
-        with open(ld.tickets / f"{time_stamp}_tickets.json", 'w') as f:
-            json.dump(self.tickets, f, sort_keys=True)
+        """
+        Save the tickets and the session game counts. The time stamp marks the end of the session so far.
+        """
+        if self.session_start is None and self.session_matches > 0:
+            self.session_start = time_stamp
+        self.session_end = time_stamp
+        snapshot = {
+            "tickets": self.tickets,
+            "session": {
+                "matches": self.session_matches,
+                "start": self.session_start,
+                "end": self.session_end,
+                "game_counts": self.session_game_counts,
+            },
+        }
+        with open(ld.history_file(ld.tickets, time_stamp, f"{time_stamp}_tickets.json"), 'w') as f:
+            json.dump(snapshot, f, sort_keys=True)
 
     @staticmethod
     def load(ld: LeagueDir) -> 'TicketSystem':
-        ticket_sys = TicketSystem()
-        if any(ld.tickets.iterdir()):
-            # Assume last tickets file is the newest, since they are prefixed with a time stamp
-            with open(list(ld.tickets.iterdir())[-1]) as f:
-                ticket_sys.tickets = json.load(f)
-
+        """
+        Load the latest tickets and the session game counts. The session consists of the matches in the
+        summary (see `LeagueSettings.last_summary`). The saved session game counts are used if they cover
+        exactly those matches. Otherwise, e.g. after a new summary was made or a match was undone, the games
+        are counted from the matches of the session.
+        """
         settings = LeagueSettings.load(ld)
-        ticket_sys.new_bot_ticket_count = settings.new_bot_ticket_count
-        ticket_sys.ticket_increase_rate = settings.ticket_increase_rate
-        ticket_sys.game_catchup_boost = settings.game_catchup_boost
-
-        matches_in_session = MatchDetails.latest(ld, settings.last_summary)
-        for match in matches_in_session:
-            bots = match.blue + match.orange
-            ticket_sys.ensure(bots)
-            for bot_id in bots:
-                ticket_sys.session_game_counts[bot_id] += 1
+        latest = ld.history(ld.tickets, 1)
+        ticket_sys = TicketSystem.read(latest[0], settings) if latest else TicketSystem._with_settings(settings)
+
+        if ticket_sys.session_matches != settings.last_summary or ticket_sys.session_end is None:
+            ticket_sys.session_game_counts = {}
+            ticket_sys.session_matches = 0
+            ticket_sys.session_start = None
+            matches_in_session = MatchDetails.latest(ld, settings.last_summary)
+            for match in matches_in_session:
+                bots = match.blue + match.orange
+                ticket_sys.ensure(bots)
+                for bot_id in bots:
+                    ticket_sys.session_game_counts[bot_id] += 1
+            ticket_sys.session_matches = len(matches_in_session)
+            if matches_in_session:
+                ticket_sys.session_start = matches_in_session[0].time_stamp
+                ticket_sys.session_end = matches_in_session[-1].time_stamp
 
         return ticket_sys
 
     @staticmethod
     def read(path: Path, settings: LeagueSettings) -> 'TicketSystem':
-        ticket_sys = TicketSystem()
+        ticket_sys = TicketSystem._with_settings(settings)
         with open(path) as f:
-            ticket_sys.tickets = json.load(f)
-            ticket_sys.new_bot_ticket_count = settings.new_bot_ticket_count
-            ticket_sys.ticket_increase_rate = settings.ticket_increase_rate
-            ticket_sys.game_catchup_boost = settings.game_catchup_boost
-            return ticket_sys
+            snapshot = json.load(f)
+        if isinstance(snapshot.get("tickets"), dict):
+            ticket_sys.tickets = snapshot["tickets"]
+            session = snapshot["session"]
+            ticket_sys.session_matches = session["matches"]
+            ticket_sys.session_start = session["start"]
+            ticket_sys.session_end = session["end"]
+            ticket_sys.session_game_counts = session["game_counts"]
+        else:
+            # Older leagues only saved the tickets
+            ticket_sys.tickets = snapshot
+        return ticket_sys
 
     @staticmethod
-    def all(ld: LeagueDir, settings: LeagueSettings):
-        first = TicketSystem()
-        first.new_bot_ticket_count = settings.new_bot_ticket_count
-        first.ticket_increase_rate = settings.ticket_increase_rate
-        first.game_catchup_boost = settings.game_catchup_boost
-        return [first] + [TicketSystem.read(path, settings) for path in list(ld.tickets.iterdir())]
+    def _with_settings(settings: LeagueSettings) -> 'TicketSystem':
+        ticket_sys = TicketSystem()
+        ticket_sys.new_bot_ticket_count = settings.new_bot_ticket_count
+        ticket_sys.ticket_increase_rate = settings.ticket_increase_rate
+        ticket_sys.game_catchup_boost = settings.game_catchup_boost
+        return ticket_sys
 
     @staticmethod
-    def undo(ld: LeagueDir):
-        """
-        Remove latest tickets file
-        """
-        if any(ld.tickets.iterdir()):
-            # Assume last tickets file is the newest, since they are prefixed with a time stamp
-            list(ld.tickets.iterdir())[-1].unlink()  # Remove file
-        else:
-            print("No tickets to undo.")
+    def all(ld: LeagueDir, settings: LeagueSettings):
+        return [TicketSystem._with_settings(settings)] + [TicketSystem.read(path, settings) for path in ld.history(ld.tickets)]
 
 
 @dataclass
@@ -376,5 +405,23 @@ class MatchMaker:
         return MatchDetails("", f"test_{bot_id}", team, team, GAME_MAP_TO_UPK["ChampionsField"])
 
 
-def make_timestamp() -> str:
-    return datetime.now().strftime("%Y%m%d%H%M%S")
+_last_time: Optional[datetime] = None
+
+
+def make_timestamp(after: Optional[str] = None) -> str:
+    """
+    Returns a time stamp of the current time with microsecond resolution (YYYYMMDDHHMMSSffffff). The time stamps
+    of a process are strictly increasing, and later than `after` if it is given, so they can be used as match ids.
+    Processes do not know each other's time stamps, so two processes can make the same time stamp. History files
+    are therefore only written while holding the league's history lock, with a time stamp later than all
+    existing history files (see `LeagueDir.latest_time_stamp`). `commit_match` restamps the match if needed, so
+    the committed matches and their ranking and ticket files never share a time stamp.
+    """
+    global _last_time
+    now = datetime.now()
+    if after is not None:
+        now = max(now, datetime.strptime(after.ljust(TIME_STAMP_LENGTH, "0"), "%Y%m%d%H%M%S%f") + timedelta(microseconds=1))
+    if _last_time is not None and now <= _last_time:
+        now = _last_time + timedelta(microseconds=1)
+    _last_time = now
+    return now.strftime("%Y%m%d%H%M%S%f")
@@ -1,13 +1,34 @@
+import hashlib
+import math
+import random
 import time
-from typing import Mapping, Tuple, Optional
+from abc import ABC, abstractmethod
+from typing import Mapping, Tuple, Optional, Dict, List
 
 from rlbot.managers import MatchManager
 from rlbot.flat import MatchPhase
 
 from bots import BotID, BotTomlConfig, fmt_bot_name
-from match import MatchDetails, MatchResult, PlayerScore
+from leaguesettings import LeagueSettings
+from match import MatchDetails, MatchResult, PlayerScore, Team, MATCH_LENGTH
+from overlay import LiveMatchFeed
 from paths import LeagueDir
+from process_monitor import ProcessMonitor
 from replays import ReplayMonitor, ReplayData
+from telemetry import TelemetryRecorder, pending_telemetry_path
+
+
+def mercy_rule_applies(league_settings: LeagueSettings, blue_goals: int, orange_goals: int, time_remaining: float,
+                       overtime: bool) -> bool:
+    """
+    Returns true if the match should be ended early, because one team leads by at least the mercy goal
+    difference with at most the mercy time remaining. This is only a threshold set by the league, not a check
+    that the result can no longer change. See the mercy settings in `LeagueSettings`.
+    """
+    if league_settings.mercy_goal_difference <= 0 or overtime:
+        return False
+    return abs(blue_goals - orange_goals) >= league_settings.mercy_goal_difference \
+        and time_remaining <= league_settings.mercy_time_remaining
 
 
 def run_match(ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, BotTomlConfig],
@@ -19,14 +40,72 @@ def run_match(ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, B
         replay_monitor = ReplayMonitor()
         replay_monitor.ensure_monitoring()
 
-        # Wait for match to end
-        while man.packet.match_info.match_phase != MatchPhase.Ended:
-            time.sleep(1.0)
+        # Record telemetry and publish live match state, if enabled, while waiting for the match to end
+        league_settings = LeagueSettings.load(ld)
+        recorder = None
+        if league_settings.telemetry_rate > 0 and match_details.time_stamp:
+            match_details.telemetry = f"{match_details.name}.tlm"
+            recorder = TelemetryRecorder(pending_telemetry_path(ld.telemetry / match_details.telemetry),
+                                         league_settings.telemetry_rate, match_details.blue + match_details.orange)
+        live_feed = None
+        if league_settings.live_feed_rate > 0:
+            live_feed = LiveMatchFeed(match_details, league_settings.live_feed_rate)
+        monitor = None
+        if league_settings.resource_monitor_interval > 0 and ProcessMonitor.available():
+            monitor = ProcessMonitor(bots, match_details.blue + match_details.orange,
+                                     league_settings.resource_monitor_interval)
+        poll_interval = 1.0
+        if recorder:
+            poll_interval = min(poll_interval, recorder.interval)
+        if live_feed:
+            poll_interval = min(poll_interval, live_feed.interval)
+        if monitor:
+            poll_interval = min(poll_interval, monitor.interval)
+
+        mercy = False
+        try:
+            while man.packet.match_info.match_phase != MatchPhase.Ended:
+                match_info = man.packet.match_info
+                if match_info.match_phase == MatchPhase.Active and mercy_rule_applies(
+                        league_settings, man.packet.teams[0].score, man.packet.teams[1].score,
+                        match_info.game_time_remaining, match_info.is_overtime):
+                    mercy = True
+                    break
+                if recorder:
+                    recorder.maybe_sample(man.packet)
+                if live_feed:
+                    live_feed.maybe_publish(man.packet)
+                if monitor and (monitor.started or match_info.match_phase == MatchPhase.Active):
+                    # The bots' processes are looked up at the first sample, when the bots are surely running
+                    monitor.maybe_sample()
+                time.sleep(poll_interval)
+            packet = man.packet
+            if recorder:
+                recorder.sample(packet)
+            if live_feed:
+                live_feed.publish(packet, mercy)
+        except BaseException:
+            # The match will not be committed, so its telemetry is discarded
+            if recorder:
+                recorder.close()
+                recorder.path.unlink(missing_ok=True)
+            raise
+        finally:
+            if live_feed:
+                # In case the match was interrupted or failed before its end was published
+                live_feed.end()
+            if recorder:
+                recorder.close()
+            if monitor:
+                match_details.resource_usage = monitor.results()
+
+        if mercy:
+            man.stop_match()
 
         # Extract results
         match_result = MatchResult(
-            blue_goals=man.packet.teams[0].score,
-            orange_goals=man.packet.teams[1].score,
+            blue_goals=packet.teams[0].score,
+            orange_goals=packet.teams[1].score,
             player_scores={
                 fmt_bot_name(pl.name): PlayerScore(
                     points=pl.score_info.score,
@@ -37,15 +116,21 @@ def run_match(ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, B
                     demolitions=pl.score_info.demolitions,
                     own_goals=pl.score_info.own_goals,
                 )
-                for pl in man.packet.players
-            }
+                for pl in packet.players
+            },
+            mercy=mercy,
+            time_remaining=0.0 if packet.match_info.is_overtime else packet.match_info.game_time_remaining,
         )
 
-        print(f"Detected match end. Result: {match_result.blue_goals}-{match_result.orange_goals}")
+        if mercy:
+            print(f"Ended match by the mercy rule with {round(match_result.time_remaining)} seconds remaining. "
+                  f"Result: {match_result.blue_goals}-{match_result.orange_goals}")
+        else:
+            print(f"Detected match end. Result: {match_result.blue_goals}-{match_result.orange_goals}")
 
-        # Handles replays
+        # Handles replays. Matches ended by the mercy rule are stopped before the game saves a replay
         replay_data = None
-        if get_replay_data:
+        if get_replay_data and not mercy:
             print("Grabbing replay file... ", end="", flush=True)
             # Use up to 30 seconds to detect replay file
             game_end_time = time.time()
@@ -62,4 +147,146 @@ def run_match(ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, B
             else:
                 print("Timeout")
 
-        return match_result, replay_data
\ No newline at end of file
+        return match_result, replay_data
+
+
+class MatchBackend(ABC):
+    """
+    A backend plays matches and returns their results. See `get_backend` for the available backends.
+    """
+    name = ""
+
+    @abstractmethod
+    def run(self, ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, BotTomlConfig],
+            get_replay_data: bool) -> Tuple[MatchResult, Optional[ReplayData]]:
+        """
+        Play the given match and return its result, and the replay data if `get_replay_data` is true
+        """
+
+
+class RLBotBackend(MatchBackend):
+    """
+    Plays matches in Rocket League using RLBot
+    """
+    name = "rlbot"
+
+    def run(self, ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, BotTomlConfig],
+            get_replay_data: bool) -> Tuple[MatchResult, Optional[ReplayData]]:
+        return run_match(ld, match_details, bots, get_replay_data)
+
+
+class SimulatedBackend(MatchBackend):
+    """
+    Simulates matches in a few milliseconds without the game. Each bot has a hidden skill derived from its id,
+    and goals are scored at random with a rate depending on the skill difference of the teams. This produces
+    plausible results, which is useful for testing the rest of the league pipeline (persistence, ranks, summary,
+    overlays, csvs) at large scale. There are no replays.
+    """
+    name = "simulated"
+
+    STEP = 10.0  # Seconds
+    GOALS_PER_SECOND = 2.5 / 300.0  # Per team, when teams are equally skilled
+    SKILL_INFLUENCE = 0.8
+
+    def __init__(self, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+
+    @staticmethod
+    def hidden_skill(bot: BotID) -> float:
+        """
+        Returns the hidden skill of the bot. The skills are normally distributed with mean 0 and deviation 1.
+        """
+        seed = int.from_bytes(hashlib.sha256(bot.encode('utf8')).digest()[:8], 'little')
+        return random.Random(seed).gauss(0.0, 1.0)
+
+    def run(self, ld: LeagueDir, match_details: MatchDetails, bots: Mapping[BotID, BotTomlConfig],
+            get_replay_data: bool) -> Tuple[MatchResult, Optional[ReplayData]]:
+        teams = [match_details.blue, match_details.orange]
+        skills = [[self.hidden_skill(bot) for bot in team] for team in teams]
+        strength = [sum(team_skills) / len(team_skills) for team_skills in skills]
+        goal_rates = [
+            self.GOALS_PER_SECOND * math.exp(self.SKILL_INFLUENCE * (strength[team] - strength[1 - team]))
+            for team in (Team.BLUE, Team.ORANGE)
+        ]
+
+        league_settings = LeagueSettings.load(ld)
+        scores = {bot: PlayerScore() for bot in match_details.blue + match_details.orange}
+        goals = [0, 0]
+        time_remaining = MATCH_LENGTH
+        mercy = False
+        while time_remaining > 0 or goals[0] == goals[1]:
+            # In overtime, the next goal wins
+            for team in (Team.BLUE, Team.ORANGE):
+                for _ in range(self._poisson(goal_rates[team] * self.STEP)):
+                    goals[team] += 1
+                    self._score_goal(teams[team], skills[team], teams[1 - team], skills[1 - team], scores)
+            time_remaining = max(0.0, time_remaining - self.STEP)
+            if time_remaining > 0 and mercy_rule_applies(league_settings, goals[0], goals[1], time_remaining, False):
+                mercy = True
+                break
+        self._add_noise(teams, skills, scores)
+
+        result = MatchResult(blue_goals=goals[0], orange_goals=goals[1], player_scores=scores,
+                             mercy=mercy, time_remaining=time_remaining)
+        if mercy:
+            print(f"Simulated match. Ended by the mercy rule with {round(time_remaining)} seconds remaining. "
+                  f"Result: {result.blue_goals}-{result.orange_goals}")
+        else:
+            print(f"Simulated match. Result: {result.blue_goals}-{result.orange_goals}")
+        return result, None
+
+    def _score_goal(self, team: List[BotID], skills: List[float], opponents: List[BotID], opponent_skills: List[float],
+                    scores: Dict[BotID, PlayerScore]):
+        if self.rng.random() < 0.03:
+            # Well, sometimes it is the opponent's fault
+            own_goaler = self.rng.choices(opponents, [math.exp(-skill) for skill in opponent_skills])[0]
+            scores[own_goaler].own_goals += 1
+            return
+        scorer = self.rng.choices(team, [math.exp(skill) for skill in skills])[0]
+        scores[scorer].goals += 1
+        scores[scorer].shots += 1
+        scores[scorer].points += 100 + 20
+        teammates = [bot for bot in team if bot != scorer]
+        # Solo scorers cannot be assisted
+        if self.rng.random() < 0.5 and teammates:
+            assister = self.rng.choice(teammates)
+            scores[assister].assists += 1
+            scores[assister].points += 50
+
+    def _add_noise(self, teams: List[List[BotID]], skills: List[List[float]], scores: Dict[BotID, PlayerScore]):
+        # Shots, saves and demolitions that did not change the score
+        for team, team_skills in zip(teams, skills):
+            for bot, skill in zip(team, team_skills):
+                score = scores[bot]
+                shots = self._poisson(2.0 * math.exp(0.3 * skill))
+                saves = self._poisson(1.5 * math.exp(0.3 * skill))
+                demolitions = self._poisson(0.5)
+                score.shots += shots
+                score.saves += saves
+                score.demolitions += demolitions
+                score.points += 20 * shots + 50 * saves + 25 * demolitions + self.rng.randint(50, 150)
+
+    def _poisson(self, mean: float) -> int:
+        # Knuth's algorithm. Fine for the small means used here
+        limit = math.exp(-mean)
+        count = 0
+        product = self.rng.random()
+        while product > limit:
+            count += 1
+            product *= self.rng.random()
+        return count
+
+
+BACKENDS = {
+    RLBotBackend.name: RLBotBackend,
+    SimulatedBackend.name: SimulatedBackend,
+}
+
+
+def get_backend(name: str) -> MatchBackend:
+    """
+    Returns a match backend by name. Raises ValueError if there is no such backend.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown match backend '{name}'. Options: {', '.join(BACKENDS.keys())}")
+    return BACKENDS[name]()
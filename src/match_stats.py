@@ -0,0 +1,80 @@
+import json
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from fileutil import write_json_atomic
+from match import MatchDetails
+from paths import LeagueDir
+
+
+class MatchStatsStore(ABC):
+    """
+    Base of the stats that are updated once per match, so queries do not require reading all the matches.
+    The stats are saved as json in the stats directory together with the number of matches they include and the
+    time stamp of the latest of them. They are rebuilt from the match history if the file is missing, unreadable,
+    or its latest match is not the latest match of the history. Saving rewrites the whole file.
+    Subclasses name their file and implement `_add_match`.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.last_match: Optional[str] = None  # The time stamp of the latest match included in the stats
+
+    @staticmethod
+    @abstractmethod
+    def file(ld: LeagueDir) -> Path:
+        """
+        Returns the path the stats are saved at
+        """
+
+    @abstractmethod
+    def _add_match(self, match: MatchDetails, sign: int):
+        """
+        Add the given match to the stats, or remove it again if the sign is -1
+        """
+
+    def add_match(self, match: MatchDetails, sign: int = 1):
+        self.count += sign
+        self._add_match(match, sign)
+
+    def remove_match(self, match: MatchDetails):
+        self.add_match(match, -1)
+
+    @classmethod
+    def build(cls, ld: LeagueDir) -> 'MatchStatsStore':
+        """
+        Build the stats from the match history
+        """
+        stats = cls()
+        for path in ld.history(ld.matches):
+            stats.add_match(MatchDetails.read(path))
+        stats.last_match = MatchDetails.latest_time_stamp(ld)
+        return stats
+
+    def save(self, ld: LeagueDir):
+        """
+        Save the stats by rewriting the file. The stats must include exactly the matches currently in the history.
+        """
+        self.last_match = MatchDetails.latest_time_stamp(ld)
+        write_json_atomic(self.file(ld), self.__dict__, separators=(",", ":"), sort_keys=True)
+
+    @classmethod
+    def load(cls, ld: LeagueDir) -> 'MatchStatsStore':
+        """
+        Load the stats. They are built from the match history if they are missing, unreadable, or out of date.
+        Only the time stamp of the latest match is compared, so loading does not list the whole history.
+        """
+        path = cls.file(ld)
+        if path.exists():
+            stats = cls()
+            try:
+                with open(path) as f:
+                    stats.__dict__.update(json.load(f))
+            except json.JSONDecodeError:
+                print(f"WARNING: {path} is corrupt. Rebuilding it from the match history.")
+            else:
+                consistent = stats.count >= 0 and (stats.count == 0) == (stats.last_match is None)
+                if consistent and stats.last_match == MatchDetails.latest_time_stamp(ld):
+                    return stats
+        return cls.build(ld)
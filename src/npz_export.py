@@ -0,0 +1,160 @@
+import csv
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import numpy
+
+# Column types of the npz tables. "time" columns are time stamps stored as datetime64[us], "bot" columns are
+# indexes into the table's `bot_names` array, and "str" columns are unicode strings. The other columns are
+# numpy dtypes. The columns are named like the columns of the csv tables.
+NPZ_COLUMNS = {
+    "bots": {
+        "bot": "bot",
+        "status": "str",
+        "developer": "str",
+        "language": "str",
+        "description": "str",
+        "fun_fact": "str",
+        "github": "str",
+    },
+    "tickets": {
+        "time": "time",
+        "bot": "bot",
+        "count": "f8",
+    },
+    "ratings": {
+        "time": "time",
+        "bot": "bot",
+        "mmr": "i4",
+        "mu": "f8",
+        "sigma": "f8",
+    },
+    "matches": {
+        "time": "time",
+        "blue_bot_1": "bot",
+        "blue_bot_2": "bot",
+        "blue_bot_3": "bot",
+        "orange_bot_1": "bot",
+        "orange_bot_2": "bot",
+        "orange_bot_3": "bot",
+        "map": "str",
+        "replay_id": "str",
+        "blue_goals": "i2",
+        "orange_goals": "i2",
+    },
+    "scores": {
+        "time": "time",
+        "bot": "bot",
+        "points": "i4",
+        "goals": "i2",
+        "shots": "i2",
+        "saves": "i2",
+        "assists": "i2",
+        "demolitions": "i2",
+        "own_goals": "i2",
+    },
+}
+
+
+def parse_time_stamps(time_stamps: List[str]) -> numpy.ndarray:
+    """
+    Convert time stamps (YYYYMMDDHHMMSS with or without microseconds) to datetime64[us]
+    """
+    return numpy.array([
+        f"{s[:4]}-{s[4:6]}-{s[6:8]}T{s[8:10]}:{s[10:12]}:{s[12:14]}.{s[14:20] or '0'}" for s in time_stamps
+    ], dtype="datetime64[us]")
+
+
+def write_npz(path: Path, table: str, rows: Iterator[list], bots: List[str]) -> int:
+    """
+    Write the rows of a table as compressed, typed columns to an npz file. Bots are stored as indexes
+    into the `bot_names` array of the file. Returns the number of rows written.
+    """
+    columns = NPZ_COLUMNS[table]
+    values: List[list] = [[] for _ in columns]
+    bot_names = list(bots)
+    bot_index = {bot: i for i, bot in enumerate(bot_names)}
+    kinds = list(columns.values())
+    count = 0
+    for row in rows:
+        for i, (kind, value) in enumerate(zip(kinds, row)):
+            if kind == "bot":
+                if value not in bot_index:
+                    bot_index[value] = len(bot_names)
+                    bot_names.append(value)
+                value = bot_index[value]
+            elif kind == "str" and value is None:
+                value = ""
+            values[i].append(value)
+        count += 1
+
+    arrays = {"bot_names": numpy.array(bot_names, dtype=str)}
+    for (name, kind), column in zip(columns.items(), values):
+        if kind == "time":
+            arrays[name] = parse_time_stamps(column)
+        elif kind == "bot":
+            arrays[name] = numpy.array(column, dtype="i2" if len(bot_names) < 2 ** 15 else "i4")
+        elif kind == "str":
+            arrays[name] = numpy.array(column, dtype=str)
+        else:
+            arrays[name] = numpy.array(column, dtype=kind)
+    numpy.savez_compressed(path, **arrays)
+    return count
+
+
+def load_table(path: Path) -> Dict[str, numpy.ndarray]:
+    """
+    Load a table exported by `csvs generate --format npz`. Returns a dict from column names to arrays.
+    Bot columns contain indexes into the `bot_names` array, e.g. `table["bot_names"][table["bot"]]`
+    gives the names of the bots column.
+    """
+    with numpy.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def load_csv_table(path: Path) -> Dict[str, list]:
+    """
+    Load a csv table into columns of strings, like a minimal csv based analysis would
+    """
+    with open(path, newline="", encoding='utf8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        columns = [[] for _ in header]
+        for row in reader:
+            for column, value in zip(columns, row):
+                column.append(value)
+    return dict(zip(header, columns))
+
+
+def benchmark(csvs: Path, table: str = "ratings", repeat: int = 5):
+    """
+    Compare the time it takes to load a table from its csv and npz file. The csv route includes converting
+    the numeric columns, such that both routes end with usable columns.
+    """
+    csv_path = csvs / f"{table}.csv"
+    npz_path = csvs / f"{table}.npz"
+    numeric = [name for name, kind in NPZ_COLUMNS[table].items() if kind not in ("time", "bot", "str")]
+
+    def load_csv():
+        columns = load_csv_table(csv_path)
+        for name in numeric:
+            columns[name] = numpy.array(columns[name], dtype=float)
+        return columns
+
+    for name, load, path in [("csv", load_csv, csv_path), ("npz", lambda: load_table(npz_path), npz_path)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            load()
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{path.name:<14} {path.stat().st_size / 1e6:>8.2f} MB  {elapsed * 1000:>8.1f} ms per load")
+
+
+if __name__ == '__main__':
+    from paths import LeagueDir
+    from settings import PersistentSettings
+
+    settings = PersistentSettings.load()
+    ld = LeagueDir(Path(settings.league_dir_raw))
+    for table in ["ratings", "scores"]:
+        benchmark(ld.csvs, table)
@@ -1,17 +1,32 @@
+import asyncio
+import base64
+import hashlib
 import json
+import mimetypes
 import shutil
 import string
-from collections import defaultdict
+import struct
+import time
 from pathlib import Path
-from typing import Mapping
+from typing import Mapping, Dict, Any, List, Set, Optional
+from urllib.parse import urlsplit, unquote
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow is optional. Without it, logos are not downscaled
+    Image = None
+
+from rlbot.flat import MatchPhase
 
 from bots import BotID, defmt_bot_name, load_all_unretired_bots, load_retired_bots, \
     BotTomlConfig
+from fileutil import write_json_atomic, write_text_atomic
 from leaguesettings import LeagueSettings
 from match import MatchDetails
 from match_maker import TicketSystem
 from paths import PackageFiles, LeagueDir
-from ranking_system import RankingSystem
+from ranking_system import RankingSystem, Leaderboard
 
 
 def make_overlay(ld: LeagueDir, match: MatchDetails, bots: Mapping[BotID, BotTomlConfig]):
@@ -21,16 +36,19 @@ def make_overlay(ld: LeagueDir, match: MatchDetails, bots: Mapping[BotID, BotTom
     """
 
     retired = load_retired_bots(ld)
-    rankings = RankingSystem.load(ld).ensure_all(list(bots.keys()))
-    rank_list = rankings.as_sorted_list(exclude=retired)
+    leaderboard = RankingSystem.load(ld).ensure_all(list(bots.keys())).leaderboard_excluding(retired)
+    logo_cache = LogoCache.load()
 
     def bot_data(bot_id):
         config = bots[bot_id]
-        rank, mmr = [(i + 1, mrr) for i, (id, mrr, sigma) in enumerate(rank_list) if id == bot_id][0]
+        rank = leaderboard.rank(bot_id)
+        mmr = leaderboard.mmr(bot_id)
+        logo = logo_cache.logo(config)
         return {
             "name": config["settings"]["name"],
             "config_path": str(config["path"]),
-            "logo_path": try_copy_logo(config),
+            "logo_path": logo["original"] if logo else None,
+            "logos": logo["variants"] if logo else None,
             "developer": config["details"].get("developer", "N/A"),
             "description": config["details"].get("description", "N/A"),
             "fun_fact": config["details"].get("fun_fact", "N/A"),
@@ -45,102 +63,323 @@ def make_overlay(ld: LeagueDir, match: MatchDetails, bots: Mapping[BotID, BotTom
         "orange": [bot_data(bot_id) for bot_id in match.orange],
         "map": match.map
     }
+    logo_cache.save()
 
-    with open(PackageFiles.overlay_current_match, 'w') as f:
-        json.dump(overlay, f, indent=4)
+    write_json_atomic(PackageFiles.overlay_current_match, overlay, skip_unchanged=True)
 
 
 def make_summary(ld: LeagueDir, count: int):
     """
     Make a summary of the N latest matches and the resulting ranks and tickets.
     If N is 0 the summary will just contain the current ratings.
+    This reads the N latest matches. Use `update_summary` to add a single match to the current summary.
     """
-    summary = {}
+    state = SummaryState.build(ld, count)
+    state.save(ld)
 
-    tickets = TicketSystem.load(ld)
+    bots = load_all_unretired_bots(ld)
+    write_summary(ld, state, RankingSystem.load(ld), TicketSystem.load(ld), bots)
+
+    league_settings = LeagueSettings.load(ld)
+    league_settings.last_summary = count
+    league_settings.save(ld)
+
+
+def update_summary(ld: LeagueDir, match: MatchDetails, rank_sys: RankingSystem, ticket_sys: TicketSystem,
+                   bots: Mapping[BotID, BotTomlConfig]):
+    """
+    Add a newly played match to the summary. The given ranking and ticket systems must be the states
+    after the match. The cost of this does not depend on the number of matches in the summary.
+    """
+    league_settings = LeagueSettings.load(ld)
+    state = SummaryState.load(ld)
+    if state is None or state.count != league_settings.last_summary:
+        # The summary state is missing or out of date, e.g. due to an undo
+        make_summary(ld, league_settings.last_summary + 1)
+        return
+
+    state.add_match(match)
+    state.save(ld)
+    write_summary(ld, state, rank_sys, ticket_sys, bots)
+
+    league_settings.last_summary = state.count
+    league_settings.save(ld)
+
+
+def write_summary(ld: LeagueDir, state: 'SummaryState', rank_sys: RankingSystem, ticket_sys: TicketSystem,
+                  bots: Mapping[BotID, BotTomlConfig]):
+    """
+    Write the summary of the given summary state with the given current ranks and tickets to `summary.json`.
+    """
+    summary = {}
 
     # ========== Matches ==========
 
-    matches = []
-    bot_wins = defaultdict(list)  # Maps bots to list of booleans, where true=win and false=loss
-
-    if count > 0:
-        latest_matches = MatchDetails.latest(ld, count)
-        for i, match in enumerate(latest_matches):
-            matches.append({
-                "index": i,
-                "blue_names": [defmt_bot_name(bot_id) for bot_id in match.blue],
-                "orange_names": [defmt_bot_name(bot_id) for bot_id in match.orange],
-                "blue_goals": match.result.blue_goals,
-                "orange_goals": match.result.orange_goals,
-            })
-            for bot in match.blue:
-                bot_wins[bot].append(match.result.blue_goals > match.result.orange_goals)
-            for bot in match.orange:
-                bot_wins[bot].append(match.result.blue_goals < match.result.orange_goals)
-
-    summary["matches"] = matches
+    summary["matches"] = [{"index": i, **match} for i, match in enumerate(state.matches)]
 
     # ========= Ranks/Ratings =========
 
-    bots = load_all_unretired_bots(ld)
     retired = load_retired_bots(ld)
-    bots_by_rank = []
-
-    if count <= 0:
-        # Old rankings and current rankings is the same, but make sure all bots have a rank currently
-        old_rankings = RankingSystem.load(ld).as_sorted_list(exclude=retired)
-        cur_rankings = RankingSystem.load(ld).ensure_all(list(bots.keys())).as_sorted_list(exclude=retired)
-    else:
-        # Determine current rank and their to N matches ago
-        n_rankings = RankingSystem.latest(ld, count + 1)
-        old_rankings = n_rankings[0].as_sorted_list(exclude=retired)
-        cur_rankings = n_rankings[-1].ensure_all(list(bots.keys())).as_sorted_list(exclude=retired)
+    old_leaderboard = Leaderboard.of(state.old_mmrs, exclude=retired)
+    cur_rankings = rank_sys.ensure_all(list(bots.keys())).as_sorted_list(exclude=retired)
 
+    bots_by_rank = []
     for i, (bot, mrr, sigma) in enumerate(cur_rankings):
-        cur_rank = i + 1
-        old_rank = None
-        old_mmr = None
-        for j, (other_bot, other_mrr, _) in enumerate(old_rankings):
-            if bot == other_bot:
-                old_rank = j + 1
-                old_mmr = other_mrr
-                break
+        old_rank = old_leaderboard.rank(bot)
+        old_mmr = old_leaderboard.mmr(bot) if old_rank is not None else None
         bots_by_rank.append({
             "bot_id": defmt_bot_name(bot),
             "mmr": mrr,
             "old_mmr": old_mmr,
             "sigma": sigma,
-            "cur_rank": cur_rank,
+            "cur_rank": i + 1,
             "old_rank": old_rank,
-            "tickets": tickets.get(bot) or tickets.new_bot_ticket_count,
-            "wins": bot_wins[bot],
+            "tickets": ticket_sys.get(bot) or ticket_sys.new_bot_ticket_count,
+            "wins": state.wins.get(bot, []),
         })
 
     summary["bots_by_rank"] = bots_by_rank
 
     # =========== Write =============
 
-    with open(PackageFiles.overlay_summary, 'w') as f:
-        json.dump(summary, f, indent=4)
+    write_json_atomic(PackageFiles.overlay_summary, summary, skip_unchanged=True)
 
-    league_settings = LeagueSettings.load(ld)
-    league_settings.last_summary = count
-    league_settings.save(ld)
 
+class SummaryState:
+    """
+    The state behind the summary, i.e. the matches of the summary, the wins and losses of each bot in those
+    matches, and the mmr of the bots before the first of those matches. The state is saved in the league
+    directory and updated once per match, so creating the summary does not require reading all the matches again.
+    """
 
-def try_copy_logo(config: BotTomlConfig):
-    logo_path = config["settings"].get("logo_file", "logo.png")
-    logo_path = Path(config["path"]).parent / config["settings"].get("root_dir", "./") / logo_path
-    if logo_path.exists():
-        root_folder = PackageFiles.overlay_dir
-        folder = root_folder / 'images' / 'logos'
-        folder.mkdir(parents=True, exist_ok=True)  # Ensure the folder exists
-        web_url = 'images/logos/' + convert_to_filename(config["settings"]["name"] + ".png")
-        target_file = root_folder / web_url
-        shutil.copy(logo_path, target_file)
-        return web_url
-    return None
+    def __init__(self):
+        self.count = 0
+        self.matches: List[Dict[str, Any]] = []
+        self.wins: Dict[BotID, List[bool]] = {}  # Maps bots to list of booleans, where true=win and false=loss
+        self.old_mmrs: Dict[BotID, int] = {}
+
+    def add_match(self, match: MatchDetails):
+        self.count += 1
+        self.matches.append({
+            "blue_names": [defmt_bot_name(bot_id) for bot_id in match.blue],
+            "orange_names": [defmt_bot_name(bot_id) for bot_id in match.orange],
+            "blue_goals": match.result.blue_goals,
+            "orange_goals": match.result.orange_goals,
+        })
+        for bot in match.blue:
+            self.wins.setdefault(bot, []).append(match.result.blue_goals > match.result.orange_goals)
+        for bot in match.orange:
+            self.wins.setdefault(bot, []).append(match.result.blue_goals < match.result.orange_goals)
+
+    @staticmethod
+    def build(ld: LeagueDir, count: int) -> 'SummaryState':
+        """
+        Build the summary state of the N latest matches from the match and rankings history
+        """
+        state = SummaryState()
+        if count > 0:
+            state.old_mmrs = RankingSystem.latest(ld, count + 1)[0].get_mmr_all()
+            for match in MatchDetails.latest(ld, count):
+                state.add_match(match)
+        else:
+            state.old_mmrs = RankingSystem.load(ld).get_mmr_all()
+        # The number of matches can be less than requested
+        state.count = count
+        return state
+
+    def save(self, ld: LeagueDir):
+        with open(ld.summary_state, 'w') as f:
+            json.dump(self.__dict__, f)
+
+    @staticmethod
+    def load(ld: LeagueDir) -> Optional['SummaryState']:
+        """
+        Load the summary state. Returns None if there is no summary state.
+        """
+        if not ld.summary_state.exists():
+            return None
+        state = SummaryState()
+        with open(ld.summary_state) as f:
+            state.__dict__.update(json.load(f))
+        return state
+
+    @staticmethod
+    def invalidate(ld: LeagueDir):
+        """
+        Remove the summary state. Must be called when matches are removed from the history.
+        """
+        ld.summary_state.unlink(missing_ok=True)
+
+
+class LiveMatchFeed:
+    """
+    Publishes the state of the ongoing match (score, time remaining, and each player's score info) to
+    `live_match.json` at most `rate` times per second while the match is played. The file is replaced atomically
+    and only when the state has changed. The overlay server pushes the changes to the overlays.
+    """
+
+    def __init__(self, match: MatchDetails, rate: float):
+        self.match_name = match.name
+        self.interval = 1.0 / rate
+        self._next_publish_time = 0.0
+        self._last_live: Optional[dict] = None
+        self._last_text = None
+
+    def maybe_publish(self, packet):
+        """
+        Publish the state of the given packet if at least `1 / rate` seconds have passed since last time
+        """
+        now = time.perf_counter()
+        if now >= self._next_publish_time:
+            self._next_publish_time = now + self.interval
+            self.publish(packet)
+
+    def publish(self, packet, mercy: bool = False):
+        """
+        Publish the state of the given packet. `mercy` tells that the match was ended by the mercy rule.
+        """
+        live = {
+            "match": self.match_name,
+            "ended": mercy or packet.match_info.match_phase == MatchPhase.Ended,
+            "mercy": mercy,
+            "time_remaining": round(packet.match_info.game_time_remaining),
+            "overtime": bool(packet.match_info.is_overtime),
+            "blue_goals": packet.teams[0].score,
+            "orange_goals": packet.teams[1].score,
+            "players": [
+                {
+                    "name": pl.name,
+                    "team": pl.team,
+                    "points": pl.score_info.score,
+                    "goals": pl.score_info.goals,
+                    "shots": pl.score_info.shots,
+                    "saves": pl.score_info.saves,
+                    "assists": pl.score_info.assists,
+                    "demolitions": pl.score_info.demolitions,
+                    "own_goals": pl.score_info.own_goals,
+                }
+                for pl in packet.players
+            ],
+        }
+        self._write(live)
+
+    def end(self):
+        """
+        Publish that the match has ended, unless that was already published. The last published state is kept.
+        This is for matches that are interrupted or fail, such that overlays do not show them as ongoing.
+        """
+        if self._last_live is not None and self._last_live["ended"]:
+            return
+        live = dict(self._last_live or {"match": self.match_name, "mercy": False})
+        live["ended"] = True
+        self._write(live)
+
+    def _write(self, live: dict):
+        self._last_live = live
+        text = json.dumps(live)
+        if text != self._last_text:
+            write_text_atomic(PackageFiles.overlay_live_match, text)
+            self._last_text = text
+
+
+# The sizes (max width, max height) at which the overlays show logos. See `overlay.css` and `versus_logos.css`
+LOGO_VARIANTS = {
+    "tip": (100, 100),
+    "herald": (400, 200),
+}
+
+
+class LogoCache:
+    """
+    Keeps copies of the bots' logos in the overlay's logo folder along with downscaled variants in the sizes
+    used by the overlays (see `LOGO_VARIANTS`). A logo is only copied and downscaled again when the content
+    of the source file has changed. The manifest maps bot names to the hash of their logo and the urls of
+    the copies, and is saved as `images/logos/manifest.json`, such that overlays can use it directly.
+    Downscaling requires Pillow. Without it, all variants are the original logo.
+    """
+
+    def __init__(self):
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        self._changed = False
+
+    @staticmethod
+    def load() -> 'LogoCache':
+        cache = LogoCache()
+        if PackageFiles.overlay_logo_manifest.exists():
+            with open(PackageFiles.overlay_logo_manifest, encoding='utf8') as f:
+                cache.manifest = json.load(f)
+        return cache
+
+    def save(self):
+        if self._changed:
+            PackageFiles.overlay_logos.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(PackageFiles.overlay_logo_manifest, self.manifest, indent=4)
+            self._changed = False
+
+    def logo(self, config: BotTomlConfig) -> Optional[Dict[str, Any]]:
+        """
+        Returns the manifest entry of the given bot's logo, or None if the bot has no logo.
+        The logo is copied and downscaled if it has changed since last time.
+        """
+        logo_path = config["settings"].get("logo_file", "logo.png")
+        logo_path = Path(config["path"]).parent / config["settings"].get("root_dir", "./") / logo_path
+        name = config["settings"]["name"]
+        if not logo_path.exists():
+            return None
+
+        entry = self.manifest.get(name)
+        stat = logo_path.stat()
+        if entry is not None and entry["source"] == str(logo_path) and entry["mtime"] == stat.st_mtime \
+                and entry["size"] == stat.st_size and self._files_exist(entry):
+            # Cheap check passed. No need to hash the file
+            return entry
+
+        with open(logo_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if entry is None or entry["hash"] != digest or not self._files_exist(entry):
+            if entry is not None:
+                self._remove_files(entry)
+            entry = self._make_copies(logo_path, name, digest)
+        entry.update(source=str(logo_path), mtime=stat.st_mtime, size=stat.st_size)
+        self.manifest[name] = entry
+        self._changed = True
+        return entry
+
+    def _make_copies(self, logo_path: Path, name: str, digest: str) -> Dict[str, Any]:
+        PackageFiles.overlay_logos.mkdir(parents=True, exist_ok=True)
+        # The hash is part of the file names, so browser sources never show a cached old version
+        base_name = f"{convert_to_filename(name)}_{digest[:8]}"
+        web_url = f"images/logos/{base_name}.png"
+        shutil.copy(logo_path, PackageFiles.overlay_dir / web_url)
+
+        variants = {}
+        for variant, size in LOGO_VARIANTS.items():
+            variants[variant] = web_url
+            if Image is None:
+                continue
+            try:
+                with Image.open(logo_path) as image:
+                    if image.width <= size[0] and image.height <= size[1]:
+                        continue
+                    image.thumbnail(size, Image.LANCZOS)
+                    variant_url = f"images/logos/{base_name}_{variant}.png"
+                    image.save(PackageFiles.overlay_dir / variant_url, "PNG")
+                    variants[variant] = variant_url
+            except OSError:
+                print(f"> Warning: Failed to downscale the logo of {name}")
+
+        return {"hash": digest, "original": web_url, "variants": variants}
+
+    @staticmethod
+    def _urls(entry: Dict[str, Any]) -> Set[str]:
+        return {entry["original"]} | set(entry["variants"].values())
+
+    def _files_exist(self, entry: Dict[str, Any]) -> bool:
+        return all((PackageFiles.overlay_dir / url).exists() for url in self._urls(entry))
+
+    def _remove_files(self, entry: Dict[str, Any]):
+        for url in self._urls(entry):
+            (PackageFiles.overlay_dir / url).unlink(missing_ok=True)
 
 
 def convert_to_filename(text):
@@ -154,3 +393,219 @@ def convert_to_filename(text):
     filename = ''.join(c for c in normalized if c in valid_chars)
     filename = filename.replace(' ', '_')  # Replace spaces with underscores
     return filename
+
+
+# ====== Overlay server ======
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Overlays with more unsent bytes than this are too slow to keep up with the patches and are disconnected
+MAX_CLIENT_BUFFER = 1 << 20
+
+
+def json_diff(old: Any, new: Any, path: Optional[List] = None) -> List[Dict[str, Any]]:
+    """
+    Returns a list of operations that turns the json value `old` into `new`. Each operation is a dict with
+    an `op` ("set" or "remove") and a `path` (list of keys and indices). "set" operations also have a `value`.
+    Objects are compared key by key and lists of equal length index by index. Other changes replace the
+    value entirely.
+    """
+    path = path or []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append({"op": "remove", "path": path + [key]})
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "set", "path": path + [key], "value": value})
+            else:
+                ops.extend(json_diff(old[key], value, path + [key]))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for i, (old_value, new_value) in enumerate(zip(old, new)):
+            ops.extend(json_diff(old_value, new_value, path + [i]))
+        return ops
+    if old == new and type(old) == type(new):
+        return []
+    return [{"op": "set", "path": path, "value": new}]
+
+
+class OverlayServer:
+    """
+    A small HTTP and WebSocket server for the overlays. It serves the overlay directory, such that OBS browser
+    sources can use e.g. `http://localhost:8765/overlay.html`, and it watches the overlay's json documents.
+    When a document changes, a versioned patch is pushed to all connected overlays through the WebSocket at `/ws`.
+
+    Messages sent to the overlays:
+    - `{"type": "snapshot", "version": v, "docs": {name: document}}` when an overlay connects.
+    - `{"type": "patch", "version": v, "doc": name, "ops": [...]}` when a document changes. See `json_diff`.
+      The version is increased by one for every patch, so overlays can detect if they missed one.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 8765, poll_interval: float = 0.1):
+        self.host = host
+        self.port = port
+        self.poll_interval = poll_interval
+        self.root = PackageFiles.overlay_dir.resolve()
+        self.documents: Dict[str, Path] = {
+            "current_match": PackageFiles.overlay_current_match,
+            "summary": PackageFiles.overlay_summary,
+            "live_match": PackageFiles.overlay_live_match,
+        }
+        self.version = 0
+        self.state: Dict[str, Any] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._clients: Set[asyncio.StreamWriter] = set()
+
+    def run(self):
+        """
+        Run the server until interrupted
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"Serving overlays on http://{self.host}:{self.port}/ (e.g. http://{self.host}:{self.port}/overlay.html)")
+        async with server:
+            await asyncio.gather(server.serve_forever(), self._watch_documents())
+
+    async def _watch_documents(self):
+        while True:
+            for name, path in self.documents.items():
+                try:
+                    mtime = path.stat().st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                if mtime != self._mtimes.get(name):
+                    self._mtimes[name] = mtime
+                    await self._reload_document(name, path)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _reload_document(self, name: str, path: Path):
+        try:
+            with open(path, encoding='utf8') as f:
+                new = json.load(f)
+        except (OSError, ValueError):
+            # Try again next time
+            del self._mtimes[name]
+            return
+        ops = json_diff(self.state.get(name), new) if name in self.state else [{"op": "set", "path": [], "value": new}]
+        self.state[name] = new
+        if ops:
+            self.version += 1
+            await self._broadcast({"type": "patch", "version": self.version, "doc": name, "ops": ops})
+
+    async def _broadcast(self, message: Dict[str, Any]):
+        frame = websocket_frame(json.dumps(message).encode('utf8'))
+        for writer in list(self._clients):
+            # The frames are not drained, such that one slow overlay cannot hold up the others. Overlays with too
+            # much unsent data are disconnected instead. They get a new snapshot when they reconnect.
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self._clients.discard(writer)
+                writer.close()
+                continue
+            writer.write(frame)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode('latin-1')
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line.strip() == "":
+                    break
+                key, _, value = line.partition(":")
+                headers[key.strip().lower()] = value.strip()
+            method, target, _ = request_line.split(" ", 2)
+            path = unquote(urlsplit(target).path)
+
+            if path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                await self._serve_websocket(reader, writer, headers)
+            else:
+                await self._serve_file(writer, method, path)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _serve_file(self, writer: asyncio.StreamWriter, method: str, path: str):
+        file = (self.root / path.lstrip("/")).resolve()
+        if file.is_dir():
+            file = file / "overlay.html"
+        if method not in ("GET", "HEAD") or self.root not in file.parents or not file.is_file():
+            writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return
+        body = file.read_bytes()
+        content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+        writer.write((
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Cache-Control: no-cache\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode('latin-1'))
+        if method == "GET":
+            writer.write(body)
+        await writer.drain()
+
+    async def _serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str]):
+        key = headers.get("sec-websocket-key")
+        if key is None:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('latin-1')).digest()).decode('latin-1')
+        writer.write((
+            f"HTTP/1.1 101 Switching Protocols\r\n"
+            f"Upgrade: websocket\r\n"
+            f"Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode('latin-1'))
+        snapshot = {"type": "snapshot", "version": self.version, "docs": self.state}
+        writer.write(websocket_frame(json.dumps(snapshot).encode('utf8')))
+        await writer.drain()
+        self._clients.add(writer)
+
+        # The overlays do not send us anything of interest, but we must answer pings and close frames
+        while True:
+            opcode, payload = await read_websocket_frame(reader)
+            if opcode == 0x8:
+                writer.write(websocket_frame(payload, opcode=0x8))
+                await writer.drain()
+                return
+            elif opcode == 0x9:
+                writer.write(websocket_frame(payload, opcode=0xA))
+                await writer.drain()
+
+
+def websocket_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """
+    Returns an unfragmented, unmasked WebSocket frame (as sent from a server) with the given payload
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < (1 << 16):
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader: asyncio.StreamReader):
+    """
+    Reads a WebSocket frame (as sent from a client) and returns its opcode and unmasked payload
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else bytes(4)
+    payload = await reader.readexactly(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
@@ -1,4 +1,22 @@
+import json
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Length of the time stamps made by `match_maker.make_timestamp` (YYYYMMDDHHMMSSffffff). Older leagues
+# have time stamps without microseconds (YYYYMMDDHHMMSS).
+TIME_STAMP_LENGTH = 20
+
+
+def history_time_stamp(path: Path) -> str:
+    """
+    Returns the time stamp that the name of the given history file starts with
+    """
+    return path.name.split("_", 1)[0]
+
+
+def history_sort_key(path: Path):
+    # Pad the older, shorter time stamps, such that they compare correctly with the newer ones
+    return history_time_stamp(path).ljust(TIME_STAMP_LENGTH, "0"), path.name
 
 
 class LeagueDir:
@@ -12,42 +30,75 @@ class LeagueDir:
     #     ...
     # matches/
     #     # This directory contains match results of previous matches. One json file for each match.
-    #     202101151506_bot1_bot2_bot3_vs_bot4_bot5_bot6.json
-    #     202101151516_bot7_bot8_bot9_vs_bot10_bot11_bot12.json
-    #     ...
+    #     # Like rankings and tickets, the files are sharded by year and month. See `history`.
+    #     2021/
+    #         01/
+    #             20210115150600000000_bot1_bot2_bot3_vs_bot4_bot5_bot6.json
+    #             20210115151600000000_bot7_bot8_bot9_vs_bot10_bot11_bot12.json
+    #             ...
     # rankings/
     #     # This direction contains the ranks of all bots
-    #     202101151506_rankings.json
-    #     202101151516_rankings.json
-    #     ...
+    #     2021/
+    #         01/
+    #             20210115150600000000_rankings.json
+    #             20210115151600000000_rankings.json
+    #             ...
     # tickets/
     #     # This direction contains the tickets of all bots
-    #     202101151506_tickets.json
-    #     202101151516_tickets.json
-    #     ...
+    #     2021/
+    #         01/
+    #             20210115150600000000_tickets.json
+    #             20210115151600000000_tickets.json
+    #             ...
     # replays/
     #     # This directory contains replays
     #     98NY24350NV120NVC34N8V120.replay
     #     JHDAJQJ11M1MGFQZXRJGNWE23.replay
     #     ...
+    # telemetry/
+    #     # This directory contains recordings of the game state during matches (if enabled). One file for each match.
+    #     202101151506_bot1_bot2_bot3_vs_bot4_bot5_bot6.tlm
+    #     ...
+    # history_index.jsonl
+    #     # Index of the files in matches/, rankings/, and tickets/ in the order they were written. See `history_index`.
+    # .history.lock
+    #     # Exists while a process writes to or removes from the history. See `fileutil.file_lock`.
     # csvs/
     #     # CSV files with data
     #     bots.csv
     #     matches.csv
     #     ratings.csv
     #     ...
+    # stats/
+    #     # Statistics computed from the history
+    #     win_matrix.npz
+    #     win_matrix.png
+    #     synergy.json
+    #     career_stats.json
+    #     match_index.sqlite
+    #     trajectories/
+    #         # The rating trajectory of each bot. See `rating_trajectory`.
+    #         bot1.jsonl
+    #         bot1.daily.jsonl
+    #         bot1.weekly.jsonl
+    #         ...
     """
 
     def __init__(self, league_dir: Path):
         self._league_dir = league_dir.absolute()
         self.league_settings = self._league_dir / "league_settings.json"
         self.retirement = self._league_dir / "retirement.json"
+        self.unzip_record = self._league_dir / "unzipped_bots.json"
         self.matches = self._league_dir / f"matches"
         self.bots = self._league_dir / "bots"
         self.rankings = self._league_dir / "rankings"
         self.tickets = self._league_dir / "tickets"
         self.replays = self._league_dir / "replays"
+        self.telemetry = self._league_dir / "telemetry"
         self.bot_summary = self._league_dir / "bot_summary.json"
+        self.summary_state = self._league_dir / "summary_state.json"
+        self.history_index = self._league_dir / "history_index.jsonl"
+        self.history_lock = self._league_dir / ".history.lock"
         self.csvs = self._league_dir / "csvs"
         self.csv_bots = self.csvs / "bots.csv"
         self.csv_matches = self.csvs / "matches.csv"
@@ -55,15 +106,126 @@ class LeagueDir:
         self.csv_ratings = self.csvs / "ratings.csv"
         self.csv_scores = self.csvs / "scores.csv"
         self.csvs_readme = self.csvs / "README.md"
+        self.csv_watermark = self.csvs / "watermark.json"
+        self.stats = self._league_dir / "stats"
+        self.win_matrix = self.stats / "win_matrix.npz"
+        self.win_matrix_image = self.stats / "win_matrix.png"
+        self.synergy = self.stats / "synergy.json"
+        self.career_stats = self.stats / "career_stats.json"
+        self.trajectories = self.stats / "trajectories"
+        self.match_index = self.stats / "match_index.sqlite"
         self._ensure_directory_structure()
 
+    def history(self, directory: Path, count: Optional[int] = None) -> List[Path]:
+        """
+        Returns the files of the given history directory (matches, rankings, or tickets) in chronological order.
+        If `count` is given, only the latest `count` files are returned, and only the newest shards are listed.
+        The files are sharded into YYYY/MM/ subdirectories by their time stamp. Files of older leagues may be
+        directly in the history directory. They are older than all sharded files.
+        """
+        newest_first = []
+        for year in sorted((d for d in directory.iterdir() if d.is_dir()), reverse=True):
+            for month in sorted((d for d in year.iterdir() if d.is_dir()), reverse=True):
+                newest_first.extend(sorted(_history_files(month), key=history_sort_key, reverse=True))
+                if count is not None and len(newest_first) >= count:
+                    return newest_first[:count][::-1]
+        newest_first.extend(sorted(_history_files(directory), key=history_sort_key, reverse=True))
+        if count is not None:
+            newest_first = newest_first[:count]
+        return newest_first[::-1]
+
+    def latest_time_stamp(self) -> Optional[str]:
+        """
+        Returns the latest time stamp of the files in matches/, rankings/, and tickets/, or None if there are none
+        """
+        latest = [self.history(directory, 1) for directory in (self.matches, self.rankings, self.tickets)]
+        return max((history_time_stamp(files[0]) for files in latest if files),
+                   key=lambda time_stamp: time_stamp.ljust(TIME_STAMP_LENGTH, "0"), default=None)
+
+    def history_file(self, directory: Path, time_stamp: str, name: str) -> Path:
+        """
+        Returns the path of a new file in the given history directory and adds it to the history index.
+        The shard directory of the time stamp is created if needed.
+        """
+        if len(time_stamp) < 6:
+            # No time stamp (e.g. test matches)
+            path = directory / name
+        else:
+            shard = directory / time_stamp[:4] / time_stamp[4:6]
+            shard.mkdir(parents=True, exist_ok=True)
+            path = shard / name
+        self._ensure_history_index()
+        with open(self.history_index, 'a', encoding='utf8') as f:
+            f.write(json.dumps(self._history_entry(path)) + "\n")
+        return path
+
+    def remove_history_file(self, path: Path):
+        """
+        Remove a file from a history directory along with its shard directories, if they become empty
+        """
+        path.unlink()
+        for directory in (path.parent, path.parent.parent):
+            if directory in (self.matches, self.rankings, self.tickets) or any(directory.iterdir()):
+                break
+            directory.rmdir()
+
+    def read_history_index(self) -> List[Tuple[int, dict]]:
+        """
+        Returns the entries of the history index along with their byte offsets in the index file. The index
+        lists the files of matches/, rankings/, and tickets/ in the order they were written. Each entry has the
+        kind (the directory), the time stamp, and the path relative to the league directory. Files may have been
+        removed since they were indexed (e.g. by `match undo`). The index is built from the directories if missing.
+        """
+        self._ensure_history_index()
+        entries = []
+        offset = 0
+        with open(self.history_index, 'rb') as f:
+            for line in f:
+                entries.append((offset, json.loads(line)))
+                offset += len(line)
+        return entries
+
+    def truncate_history_index(self, offset: int):
+        """
+        Remove all entries of the history index from the given byte offset and onwards
+        """
+        with open(self.history_index, 'r+b') as f:
+            f.truncate(offset)
+
+    def _history_entry(self, path: Path) -> dict:
+        return {
+            "kind": path.relative_to(self._league_dir).parts[0],
+            "time_stamp": history_time_stamp(path),
+            "path": path.relative_to(self._league_dir).as_posix(),
+        }
+
+    def _ensure_history_index(self):
+        if self.history_index.exists():
+            return
+        # Files written at the same time (by the same commit) are ordered like `match_commit.commit_match` does
+        kinds = [self.matches, self.rankings, self.tickets]
+        paths = sorted(
+            ((path, order) for order, directory in enumerate(kinds) for path in self.history(directory)),
+            key=lambda item: (history_sort_key(item[0])[0], item[1])
+        )
+        with open(self.history_index, 'w', encoding='utf8') as f:
+            for path, _ in paths:
+                f.write(json.dumps(self._history_entry(path)) + "\n")
+
     def _ensure_directory_structure(self):
         self.matches.mkdir(exist_ok=True)
         self.rankings.mkdir(exist_ok=True)
         self.tickets.mkdir(exist_ok=True)
         self.bots.mkdir(exist_ok=True)
         self.replays.mkdir(exist_ok=True)
+        self.telemetry.mkdir(exist_ok=True)
         self.csvs.mkdir(exist_ok=True)
+        self.stats.mkdir(exist_ok=True)
+
+
+def _history_files(directory: Path) -> List[Path]:
+    # Skips subdirectories and temporary files
+    return [path for path in directory.iterdir() if path.is_file() and not path.name.startswith(".")]
 
 
 class PackageFiles:
@@ -83,3 +245,6 @@ class PackageFiles:
 
     overlay_current_match = overlay_dir / "current_match.json"
     overlay_summary = overlay_dir / "summary.json"
+    overlay_live_match = overlay_dir / "live_match.json"
+    overlay_logos = overlay_dir / "images" / "logos"
+    overlay_logo_manifest = overlay_logos / "manifest.json"
@@ -0,0 +1,222 @@
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Set, List
+
+from bots import BotID, BotTomlConfig
+
+PROC = Path("/proc")
+
+
+@dataclass
+class ResourceUsage:
+    """
+    Object that contains the averages and peaks of a bot's resource usage during a match.
+    The numbers cover the bot's entire process tree. CPU usage is in percent of one core.
+    """
+    samples: int = 0
+    cpu_time: float = 0.0  # Seconds
+    cpu_avg: float = 0.0
+    cpu_peak: float = 0.0
+    rss_avg: float = 0.0  # MB
+    rss_peak: float = 0.0
+    threads_avg: float = 0.0
+    threads_peak: int = 0
+
+
+@dataclass
+class _ProcessSample:
+    ppid: int
+    cpu_time: float
+    rss: float
+    threads: int
+
+
+class ProcessMonitor:
+    """
+    Samples the CPU time, memory (RSS), and thread count of each bot's process tree from /proc at a fixed
+    interval. A bot's processes are found as the processes running in the bot's directory and their descendants.
+    All of /proc is only scanned once, at the first sample, so create the monitor once the bots are running. Later
+    samples only read the processes found then and their current descendants.
+    Psyonix bots have no processes and are not monitored. Monitoring is only available on systems with /proc.
+    """
+
+    def __init__(self, bots: Mapping[BotID, BotTomlConfig], bot_ids: List[BotID], interval: float = 1.0):
+        self.interval = interval
+        self._bot_dirs: Dict[BotID, Path] = {}
+        for bot_id in set(bot_ids):
+            config = bots[bot_id]
+            if config["settings"].get("psyonix_skill") is None:
+                root_dir = Path(config["path"]).parent / config["settings"].get("root_dir", "./")
+                self._bot_dirs[bot_id] = root_dir.resolve()
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._next_sample_time = 0.0
+        self._trees: Optional[Dict[BotID, Set[int]]] = None  # The pids of each bot's process tree
+        self._last_time: Optional[float] = None
+        self._last_cpu: Dict[BotID, float] = {}
+        self._first_cpu: Dict[BotID, float] = {}
+        self._usage: Dict[BotID, ResourceUsage] = {}
+        self._sums: Dict[BotID, List[float]] = {}
+
+    @staticmethod
+    def available() -> bool:
+        return PROC.is_dir() and hasattr(os, "sysconf")
+
+    @property
+    def started(self) -> bool:
+        """
+        Whether the bots' processes have been looked up, i.e. the first sample was taken
+        """
+        return self._trees is not None
+
+    def maybe_sample(self):
+        """
+        Sample the bots' processes if at least `interval` seconds have passed since the last sample
+        """
+        now = time.perf_counter()
+        if now >= self._next_sample_time:
+            self._next_sample_time = now + self.interval
+            self.sample()
+
+    def sample(self):
+        now = time.perf_counter()
+        if self._trees is None:
+            processes = self._read_processes(int(entry.name) for entry in PROC.iterdir() if entry.name.isdigit())
+            self._trees = self._find_trees(processes)
+        else:
+            self._trees = {bot_id: self._descendants(pids) for bot_id, pids in self._trees.items()}
+            processes = self._read_processes(set().union(*self._trees.values()))
+        for bot_id, pids in self._trees.items():
+            # Processes that ended are forgotten
+            pids.intersection_update(processes)
+            if not pids:
+                continue
+            cpu = sum(processes[pid].cpu_time for pid in pids)
+            rss = sum(processes[pid].rss for pid in pids)
+            threads = sum(processes[pid].threads for pid in pids)
+
+            usage = self._usage.setdefault(bot_id, ResourceUsage())
+            sums = self._sums.setdefault(bot_id, [0.0, 0.0, 0.0])
+            self._first_cpu.setdefault(bot_id, cpu)
+            if self._last_time is not None and bot_id in self._last_cpu:
+                # Processes may come and go, so the CPU time of the tree can decrease
+                cpu_percent = max(0.0, cpu - self._last_cpu[bot_id]) / (now - self._last_time) * 100.0
+                usage.cpu_peak = max(usage.cpu_peak, cpu_percent)
+                sums[0] += cpu_percent
+            self._last_cpu[bot_id] = cpu
+
+            usage.samples += 1
+            usage.rss_peak = max(usage.rss_peak, rss)
+            usage.threads_peak = max(usage.threads_peak, threads)
+            sums[1] += rss
+            sums[2] += threads
+        self._last_time = now
+
+    def results(self) -> Dict[BotID, ResourceUsage]:
+        """
+        Returns the averages and peaks of each bot that had processes during the match
+        """
+        for bot_id, usage in self._usage.items():
+            sums = self._sums[bot_id]
+            usage.cpu_time = round(self._last_cpu[bot_id] - self._first_cpu[bot_id], 3)
+            usage.cpu_avg = round(sums[0] / max(1, usage.samples - 1), 2)
+            usage.cpu_peak = round(usage.cpu_peak, 2)
+            usage.rss_avg = round(sums[1] / usage.samples, 2)
+            usage.rss_peak = round(usage.rss_peak, 2)
+            usage.threads_avg = round(sums[2] / usage.samples, 2)
+        return self._usage
+
+    def _read_processes(self, pids: Iterable[int]) -> Dict[int, _ProcessSample]:
+        processes = {}
+        for pid in pids:
+            entry = PROC / str(pid)
+            try:
+                with open(entry / "stat") as f:
+                    stat = f.read()
+                # The process name is in parentheses and may contain spaces, so we split after it
+                fields = stat[stat.rindex(")") + 2:].split()
+                with open(entry / "statm") as f:
+                    resident_pages = int(f.read().split()[1])
+            except (OSError, ValueError, IndexError):
+                # The process ended while we were reading it
+                continue
+            processes[pid] = _ProcessSample(
+                ppid=int(fields[1]),
+                cpu_time=(int(fields[11]) + int(fields[12])) / self._clock_ticks,
+                rss=resident_pages * self._page_size / 1e6,
+                threads=int(fields[17]),
+            )
+        return processes
+
+    def _find_trees(self, processes: Dict[int, _ProcessSample]) -> Dict[BotID, Set[int]]:
+        children: Dict[int, List[int]] = {}
+        for pid, process in processes.items():
+            children.setdefault(process.ppid, []).append(pid)
+
+        trees: Dict[BotID, Set[int]] = {}
+        for pid in processes:
+            try:
+                cwd = Path(os.readlink(PROC / str(pid) / "cwd"))
+            except OSError:
+                continue
+            for bot_id, bot_dir in self._bot_dirs.items():
+                if cwd == bot_dir or bot_dir in cwd.parents:
+                    trees.setdefault(bot_id, set()).add(pid)
+
+        # Add descendants
+        for pids in trees.values():
+            stack = list(pids)
+            while stack:
+                for child in children.get(stack.pop(), []):
+                    if child not in pids:
+                        pids.add(child)
+                        stack.append(child)
+        return trees
+
+    @staticmethod
+    def _descendants(pids: Set[int]) -> Set[int]:
+        """
+        Returns the given processes and the processes started by them since, using the children lists in /proc.
+        Without children lists (older kernels), new processes are not found.
+        """
+        found = set(pids)
+        stack = list(pids)
+        while stack:
+            try:
+                tasks = list((PROC / str(stack.pop()) / "task").iterdir())
+            except OSError:
+                continue
+            for task in tasks:
+                try:
+                    with open(task / "children") as f:
+                        children = [int(child) for child in f.read().split()]
+                except (OSError, ValueError):
+                    continue
+                for child in children:
+                    if child not in found:
+                        found.add(child)
+                        stack.append(child)
+        return found
+
+
+def aggregate_usage(usages: List[ResourceUsage]) -> ResourceUsage:
+    """
+    Combine the resource usage of multiple matches. Averages are weighted by the number of samples.
+    """
+    total = ResourceUsage()
+    for usage in usages:
+        total.samples += usage.samples
+        total.cpu_time += usage.cpu_time
+        total.cpu_avg += usage.cpu_avg * usage.samples
+        total.cpu_peak = max(total.cpu_peak, usage.cpu_peak)
+        total.rss_avg += usage.rss_avg * usage.samples
+        total.rss_peak = max(total.rss_peak, usage.rss_peak)
+        total.threads_avg += usage.threads_avg * usage.samples
+        total.threads_peak = max(total.threads_peak, usage.threads_peak)
+    if total.samples > 0:
+        total.cpu_avg /= total.samples
+        total.rss_avg /= total.samples
+        total.threads_avg /= total.samples
+    return total
@@ -0,0 +1,184 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Collection, List, Optional, Tuple
+
+import numpy
+import trueskill
+
+from bots import BotID, defmt_bot_name
+from match import MatchDetails
+from paths import LeagueDir
+from ranking_system import RankingSystem
+
+
+@dataclass
+class MatchArrays:
+    """
+    The match history as arrays, such that it can be replayed for many resamples at once.
+    Teams are padded with the index `len(bots)`, which is a dummy bot, and masked.
+    """
+    bots: List[BotID]
+    winners: numpy.ndarray  # (matches, team size) bot indexes
+    losers: numpy.ndarray
+    winners_mask: numpy.ndarray  # (matches, team size) true for real players
+    losers_mask: numpy.ndarray
+    rounds: numpy.ndarray  # (matches,) the number of TrueSkill updates of each match
+
+    @staticmethod
+    def of(matches: List[MatchDetails], bots: List[BotID]) -> 'MatchArrays':
+        bots = list(bots)
+        index = {bot: i for i, bot in enumerate(bots)}
+        for match in matches:
+            for bot in match.blue + match.orange:
+                if bot not in index:
+                    index[bot] = len(bots)
+                    bots.append(bot)
+        dummy = len(bots)
+        size = max([len(match.blue) for match in matches] + [len(match.orange) for match in matches] + [1])
+
+        winners = numpy.full((len(matches), size), dummy, dtype=numpy.int32)
+        losers = numpy.full((len(matches), size), dummy, dtype=numpy.int32)
+        rounds = numpy.zeros(len(matches), dtype=numpy.int32)
+        for m, match in enumerate(matches):
+            blue_won = match.result.blue_goals > match.result.orange_goals
+            won, lost = (match.blue, match.orange) if blue_won else (match.orange, match.blue)
+            winners[m, :len(won)] = [index[bot] for bot in won]
+            losers[m, :len(lost)] = [index[bot] for bot in lost]
+            rounds[m] = RankingSystem.rating_rounds(match.result)
+        return MatchArrays(bots, winners, losers, winners != dummy, losers != dummy, rounds)
+
+
+def _erfc(x: numpy.ndarray) -> numpy.ndarray:
+    # The approximation used by trueskill's default backend, such that the results are the same
+    z = numpy.abs(x)
+    t = 1. / (1. + z / 2.)
+    r = t * numpy.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+        0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+            0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277
+            )))
+        )))
+    )))
+    return numpy.where(x < 0, 2. - r, r)
+
+
+def replay(arrays: MatchArrays, samples: numpy.ndarray,
+           env: trueskill.TrueSkill) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Replay `RankingSystem.update` for a batch of resamples of the match history at once. `samples` is a
+    (resamples, matches) array of match indexes in the order they are played. Returns the final mu and sigma
+    of each bot in each resample as (resamples, bots) arrays.
+
+    For two teams, the TrueSkill factor graph has a closed form, which is what is computed here.
+    """
+    count = samples.shape[0]
+    bots = len(arrays.bots) + 1  # Including the dummy bot
+    mu = numpy.full((count, bots), env.mu)
+    var = numpy.full((count, bots), env.sigma ** 2)
+    rows = numpy.arange(count)[:, None]
+
+    for k in range(samples.shape[1]):
+        m = samples[:, k]
+        winners, losers = arrays.winners[m], arrays.losers[m]
+        winners_mask, losers_mask = arrays.winners_mask[m], arrays.losers_mask[m]
+        players = winners_mask.sum(axis=1) + losers_mask.sum(axis=1)
+        draw_margin = env.ppf((env.draw_probability + 1) / 2.) * numpy.sqrt(players) * env.beta
+        for r in range(arrays.rounds[m].max()):
+            active = (arrays.rounds[m] > r)[:, None]
+            win_mu = numpy.where(winners_mask, mu[rows, winners], 0.0)
+            lose_mu = numpy.where(losers_mask, mu[rows, losers], 0.0)
+            win_var = numpy.where(winners_mask, var[rows, winners] + env.tau ** 2, 0.0)
+            lose_var = numpy.where(losers_mask, var[rows, losers] + env.tau ** 2, 0.0)
+
+            c = numpy.sqrt(win_var.sum(axis=1) + lose_var.sum(axis=1) + players * env.beta ** 2)
+            x = (win_mu.sum(axis=1) - lose_mu.sum(axis=1) - draw_margin) / c
+            cdf = 0.5 * _erfc(-x / math.sqrt(2))
+            pdf = numpy.exp(-x ** 2 / 2) / math.sqrt(2 * math.pi)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                v = numpy.where(cdf > 0, pdf / cdf, -x)
+            w = v * (v + x)
+            v, w, c = v[:, None], w[:, None], c[:, None]
+
+            new_win_mu = win_mu + win_var / c * v
+            new_lose_mu = lose_mu - lose_var / c * v
+            new_win_var = win_var * (1 - win_var / c ** 2 * w)
+            new_lose_var = lose_var * (1 - lose_var / c ** 2 * w)
+
+            win_update = active & winners_mask
+            lose_update = active & losers_mask
+            mu[rows, winners] = numpy.where(win_update, new_win_mu, mu[rows, winners])
+            var[rows, winners] = numpy.where(win_update, new_win_var, var[rows, winners])
+            mu[rows, losers] = numpy.where(lose_update, new_lose_mu, mu[rows, losers])
+            var[rows, losers] = numpy.where(lose_update, new_lose_var, var[rows, losers])
+
+    return mu[:, :-1], numpy.sqrt(var[:, :-1])
+
+
+def _replay_batch(arrays: MatchArrays, seed: int, count: int) -> numpy.ndarray:
+    """
+    Resample the match history `count` times and return the resulting mmrs (unrounded) as a (count, bots) array
+    """
+    RankingSystem.setup()
+    rng = numpy.random.default_rng(seed)
+    matches = len(arrays.rounds)
+    # Resampled matches are played in their original order
+    samples = numpy.sort(rng.integers(0, matches, size=(count, matches)), axis=1)
+    mu, sigma = replay(arrays, samples, trueskill.global_env())
+    return mu - sigma
+
+
+@dataclass
+class RankConfidence:
+    bots: List[BotID]  # In the order of the current leaderboard
+    mmrs: List[int]
+    rank_low: numpy.ndarray  # The best rank of each bot in the confidence interval (1 is best)
+    rank_high: numpy.ndarray
+    ordered: numpy.ndarray  # The probability that each bot is above the next bot of the leaderboard
+
+
+def rank_confidence(ld: LeagueDir, resamples: int = 1000, workers: Optional[int] = None,
+                    exclude: Collection[BotID] = (), confidence: float = 0.95) -> RankConfidence:
+    """
+    Estimate how stable the leaderboard is by bootstrapping: The match history is resampled with replacement,
+    the ratings are computed from each resample, and the resulting ranks are summarized per bot. The resamples
+    are replayed in batches by a pool of processes.
+    """
+    rank_sys = RankingSystem.load(ld)
+    leaderboard = [bot for bot, _, _ in rank_sys.as_sorted_list(set(exclude))]
+    arrays = MatchArrays.of(MatchDetails.all(ld), leaderboard)
+
+    workers = workers or os.cpu_count() or 1
+    # One large batch per worker, since each step of a replay costs about the same regardless of the batch size
+    batches = max(1, min(workers, resamples))
+    sizes = [resamples // batches + (1 if i < resamples % batches else 0) for i in range(batches)]
+    seeds = numpy.random.SeedSequence().spawn(batches)
+    seeds = [int(seed.generate_state(1)[0]) for seed in seeds]
+    if workers > 1 and batches > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            mmrs = numpy.concatenate(list(executor.map(_replay_batch, [arrays] * batches, seeds, sizes)))
+    else:
+        mmrs = numpy.concatenate([_replay_batch(arrays, seed, size) for seed, size in zip(seeds, sizes)])
+
+    # Rank the bots of the leaderboard in each resample. They are the first bots of the arrays.
+    mmrs = mmrs[:, :len(leaderboard)]
+    ranks = numpy.empty_like(mmrs, dtype=numpy.int32)
+    ranks[numpy.arange(len(mmrs))[:, None], numpy.argsort(-mmrs, axis=1)] = numpy.arange(1, len(leaderboard) + 1)
+
+    tail = (1 - confidence) / 2 * 100
+    return RankConfidence(
+        bots=leaderboard,
+        mmrs=[rank_sys.get_mmr(bot) for bot in leaderboard],
+        rank_low=numpy.percentile(ranks, tail, axis=0, method='lower'),
+        rank_high=numpy.percentile(ranks, 100 - tail, axis=0, method='higher'),
+        ordered=(mmrs[:, :-1] > mmrs[:, 1:]).mean(axis=0),
+    )
+
+
+def print_rank_confidence(result: RankConfidence):
+    print(f"rank {'': <22} mmr  95% ranks  P(above next)")
+    for i, bot in enumerate(result.bots):
+        interval = f"{result.rank_low[i]}-{result.rank_high[i]}"
+        ordered = f"{result.ordered[i]:.2f}" if i < len(result.ordered) else ""
+        print(f"{i + 1:>4} {defmt_bot_name(bot) + ' ':.<22} {result.mmrs[i]:>3}  {interval:>9}  {ordered:>13}")
@@ -1,5 +1,6 @@
+from bisect import bisect_left, insort
 from pathlib import Path
-from typing import Dict, List, Tuple, Set
+from typing import Dict, List, Tuple, Set, Optional, Collection, FrozenSet
 import json
 
 import trueskill
@@ -8,6 +9,74 @@ from trueskill import Rating, TrueSkill
 from bots import BotID, defmt_bot_name
 from match import MatchDetails, MatchResult
 from paths import LeagueDir
+from rating_trajectory import append_ratings
+
+
+class Leaderboard:
+    """
+    Bots sorted by mmr (highest first) along with an index from bots to their mmr. Bots with equal mmr are
+    sorted by bot id. Updating a bot's mmr and finding a bot's rank does not require sorting all bots again.
+    Excluded bots (e.g. retired bots) are given when the leaderboard is made. They keep their mmr, but are left out
+    of the order, so ranks and top lists are found without looking at them. Updates insert into a sorted list,
+    which moves O(n) entries, but that is only a memory move and cheap for the number of bots of a league.
+    """
+
+    def __init__(self, exclude: Collection[BotID] = ()):
+        self._order: List[Tuple[int, BotID]] = []  # Sorted list of (-mmr, bot id) of the bots that are not excluded
+        self._mmrs: Dict[BotID, int] = {}
+        self._excluded: FrozenSet[BotID] = frozenset(exclude)
+
+    @staticmethod
+    def of(mmrs: Dict[BotID, int], exclude: Collection[BotID] = ()) -> 'Leaderboard':
+        """
+        Returns a leaderboard of the given bots and mmrs without the excluded bots
+        """
+        leaderboard = Leaderboard(exclude)
+        leaderboard._mmrs = dict(mmrs)
+        leaderboard._order = sorted((-mmr, bot) for bot, mmr in mmrs.items() if bot not in leaderboard._excluded)
+        return leaderboard
+
+    def set(self, bot: BotID, mmr: int):
+        """
+        Add the bot to the leaderboard or update its mmr
+        """
+        old_mmr = self._mmrs.get(bot)
+        if old_mmr == mmr:
+            return
+        self._mmrs[bot] = mmr
+        if bot in self._excluded:
+            return
+        if old_mmr is not None:
+            del self._order[bisect_left(self._order, (-old_mmr, bot))]
+        insort(self._order, (-mmr, bot))
+
+    def mmr(self, bot: BotID) -> Optional[int]:
+        """
+        Returns the mmr of the given bot, also if it is excluded, or None if the bot is not on the leaderboard
+        """
+        return self._mmrs.get(bot)
+
+    def rank(self, bot: BotID) -> Optional[int]:
+        """
+        Returns the rank of the given bot (1 is best). Returns None if the bot is not on the leaderboard or excluded.
+        """
+        mmr = self._mmrs.get(bot)
+        if mmr is None or bot in self._excluded:
+            return None
+        return bisect_left(self._order, (-mmr, bot)) + 1
+
+    def top(self, count: Optional[int] = None) -> List[Tuple[BotID, int]]:
+        """
+        Returns the best `count` bots (all if None) that are not excluded and their mmr in order
+        """
+        return [(bot, -neg_mmr) for neg_mmr, bot in self._order[:count]]
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+# The number of leaderboards with different excluded bots that a RankingSystem keeps up to date
+MAX_LEADERBOARDS = 4
 
 
 class RankingSystem:
@@ -17,16 +86,45 @@ class RankingSystem:
     """
     def __init__(self):
         self.ratings: Dict[BotID, Rating] = {}
+        self._leaderboards: Dict[FrozenSet[BotID], Leaderboard] = {}  # By the set of excluded bots
+        self._updated: Set[BotID] = set()  # Bots whose rating changed since the last save
+
+    @property
+    def leaderboard(self) -> Leaderboard:
+        """
+        The leaderboard of all bots with a rating. It is kept up to date when ratings change.
+        """
+        return self.leaderboard_excluding(())
+
+    def leaderboard_excluding(self, exclude: Collection[BotID]) -> Leaderboard:
+        """
+        The leaderboard of the bots with a rating except the excluded bots (e.g. retired bots). Like `leaderboard`,
+        it is kept up to date when ratings change. Only the `MAX_LEADERBOARDS` most recently used sets of excluded
+        bots keep their leaderboard, others are made again when needed.
+        """
+        key = frozenset(exclude)
+        leaderboard = self._leaderboards.pop(key, None)
+        if leaderboard is None:
+            leaderboard = Leaderboard.of(self.get_mmr_all(), key)
+            if len(self._leaderboards) >= MAX_LEADERBOARDS:
+                # Forget the least recently used leaderboard
+                del self._leaderboards[next(iter(self._leaderboards))]
+        # Most recently used last
+        self._leaderboards[key] = leaderboard
+        return leaderboard
+
+    def _set_rating(self, bot: BotID, rating: Rating):
+        self.ratings[bot] = rating
+        for leaderboard in self._leaderboards.values():
+            leaderboard.set(bot, self.get_mmr(bot))
 
     def get(self, bot: BotID) -> Rating:
         """
         Returns the rating of the given bot. A rating for the bot is created, if it does not exist already.
         """
-        if bot in self.ratings:
-            return self.ratings[bot]
-        else:
-            self.ratings[bot] = Rating()
-            return self.ratings[bot]
+        if bot not in self.ratings:
+            self._set_rating(bot, Rating())
+        return self.ratings[bot]
 
     def ensure_all(self, bots: List[BotID]) -> 'RankingSystem':
         """
@@ -63,17 +161,32 @@ class RankingSystem:
 
         new_blue_ratings = blue_ratings
         new_orange_ratings = orange_ratings
-        # Award a TrueSkull win for every 3 goal lead (at least 1)
-        for _ in range(1 + abs(result.blue_goals - result.orange_goals) // 4):
+        for _ in range(RankingSystem.rating_rounds(result)):
             # Rank each team for TrueSkill calculations. 0 is best (winner)
             ranks = [0, 1] if result.blue_goals > result.orange_goals else [1, 0]
             new_blue_ratings, new_orange_ratings = trueskill.rate([new_blue_ratings, new_orange_ratings], ranks=ranks)
 
         # Update bot ratings
         for i, bot_id in enumerate(match.blue):
-            self.ratings[bot_id] = new_blue_ratings[i]
+            self._set_rating(bot_id, new_blue_ratings[i])
         for i, bot_id in enumerate(match.orange):
-            self.ratings[bot_id] = new_orange_ratings[i]
+            self._set_rating(bot_id, new_orange_ratings[i])
+        self._updated.update(match.blue + match.orange)
+
+    @staticmethod
+    def rating_rounds(result: MatchResult) -> int:
+        """
+        Returns the number of TrueSkill wins awarded for the given match result. A TrueSkill win is awarded
+        for every 3 goal lead (at least 1).
+        """
+        goal_diff = abs(result.blue_goals - result.orange_goals)
+        if result.mercy:
+            # The match was ended early, so the lead is smaller than it would have been after a full match.
+            # We extrapolate the lead to the full match length, such that blowouts are rated like blowouts.
+            # The extrapolation is capped at twice the actual lead, since an early lead says little about
+            # the final score, and an uncapped extrapolation would turn a small early lead into a rout.
+            goal_diff = min(round(goal_diff / max(result.played_fraction(), 0.1)), 2 * goal_diff)
+        return 1 + goal_diff // 4
 
     def print_ranks_and_mmr(self, exclude: Set[BotID] = {}):
         """
@@ -89,22 +202,25 @@ class RankingSystem:
         Returns the sorted list of ranks. That is, a list where each element is a tuple of bot id, mmr,
         and sigma (uncertainty), and the list is sorted by mmr.
         """
-        ranks = [(bot_id, self.get_mmr(bot_id), self.get(bot_id).sigma) for bot_id in self.ratings.keys() if bot_id not in exclude]
-        ranks.sort(reverse=True, key=lambda elem: elem[1])
-        return ranks
+        return [(bot_id, mmr, self.ratings[bot_id].sigma) for bot_id, mmr in self.leaderboard_excluding(exclude).top()]
 
     def save(self, ld: LeagueDir, time_stamp: str):
-        with open(ld.rankings / f"{time_stamp}_rankings.json", 'w') as f:
+        """
+        Save the ranking system and append the changed ratings to the rating trajectories of the bots
+        """
+        with open(ld.history_file(ld.rankings, time_stamp, f"{time_stamp}_rankings.json"), 'w') as f:
             json.dump(self, f, cls=RankEncoder, sort_keys=True)
+        append_ratings(ld, time_stamp, {bot: self.ratings[bot] for bot in sorted(self._updated)})
+        self._updated = set()
 
     @staticmethod
     def load(ld: LeagueDir) -> 'RankingSystem':
         """
         Loads the latest ranking system file (or create a new ranking system if no file exists)
         """
-        if any(ld.rankings.iterdir()):
-            # Assume last rankings file is the newest, since they are prefixed with a time stamp
-            with open(list(ld.rankings.iterdir())[-1]) as f:
+        latest = ld.history(ld.rankings, 1)
+        if latest:
+            with open(latest[0]) as f:
                 return json.load(f, object_hook=as_rankings)
         # New rankings
         return RankingSystem()
@@ -122,7 +238,7 @@ class RankingSystem:
         """
         Returns the latest N states of the ranking system
         """
-        rankings = [RankingSystem.read(path) for path in list(ld.rankings.iterdir())[-count:]]
+        rankings = [RankingSystem.read(path) for path in ld.history(ld.rankings, count)]
         if len(rankings) < count:
             # Prepend empty rankings if more were requested
             return [RankingSystem()] + rankings
@@ -134,18 +250,7 @@ class RankingSystem:
         """
         Returns all previous states of the ranking system in chronological order
         """
-        return [RankingSystem()] + [RankingSystem.read(path) for path in list(ld.rankings.iterdir())]
-
-    @staticmethod
-    def undo(ld: LeagueDir):
-        """
-        Remove latest rankings file
-        """
-        if any(ld.rankings.iterdir()):
-            # Assume last rankings file is the newest, since they are prefixed with a time stamp
-            list(ld.rankings.iterdir())[-1].unlink()   # Remove file
-        else:
-            print("No rankings to undo.")
+        return [RankingSystem()] + [RankingSystem.read(path) for path in ld.history(ld.rankings)]
 
     @staticmethod
     def setup():
@@ -173,6 +278,9 @@ class RankEncoder(json.JSONEncoder):
             if not isinstance(obj, cls):
                 continue
             json_obj = obj.__dict__.copy()
+            if isinstance(obj, RankingSystem):
+                json_obj.pop('_leaderboards', None)
+                json_obj.pop('_updated', None)
             if isinstance(obj, TrueSkill):
                 del json_obj['cdf']
                 del json_obj['pdf']
@@ -191,6 +299,7 @@ def as_rankings(json_obj) -> RankingSystem:
             continue
         obj = cls()
         del json_obj[tag]
-        obj.__dict__ = json_obj
+        # Keeps the attributes that are not saved, e.g. the leaderboards of the RankingSystem
+        obj.__dict__.update(json_obj)
         return obj
     return json_obj
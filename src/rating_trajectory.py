@@ -0,0 +1,170 @@
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from trueskill import Rating
+
+from bots import BotID
+from paths import LeagueDir, TIME_STAMP_LENGTH, history_time_stamp
+
+# The rating trajectory of each bot is a list of points (time stamp, mu, sigma), one for each time its rating
+# changed. The points of a bot are appended to `<bot>.jsonl` in the trajectories directory. The downsampled
+# series `<bot>.daily.jsonl` and `<bot>.weekly.jsonl` contain the last point of each day/week and are kept
+# up to date along with the points, such that they never have to be computed from the full history. The time
+# of a downsampled point is the first day of its period (YYYYMMDD).
+
+Point = Tuple[str, float, float]
+
+
+def day_period(time_stamp: str) -> str:
+    return time_stamp[:8]
+
+
+def week_period(time_stamp: str) -> str:
+    day = datetime.strptime(time_stamp[:8], "%Y%m%d")
+    return (day - timedelta(days=day.weekday())).strftime("%Y%m%d")
+
+
+PERIODS = {
+    "daily": day_period,
+    "weekly": week_period,
+}
+
+
+def trajectory_file(ld: LeagueDir, bot: BotID, period: Optional[str] = None) -> Path:
+    return ld.trajectories / (f"{bot}.jsonl" if period is None else f"{bot}.{period}.jsonl")
+
+
+def read_trajectory(ld: LeagueDir, bot: BotID, period: Optional[str] = None) -> List[Point]:
+    """
+    Returns the rating trajectory of a bot in chronological order, either every point or downsampled to
+    the given period ("daily" or "weekly"). Only the files of the bot are read.
+    """
+    ensure_trajectories(ld)
+    path = trajectory_file(ld, bot, period)
+    if not path.exists():
+        return []
+    with open(path, encoding='utf8') as f:
+        return [tuple(json.loads(line)) for line in f]
+
+
+def append_ratings(ld: LeagueDir, time_stamp: str, ratings: Dict[BotID, Rating]):
+    """
+    Append the given new ratings to the trajectories of their bots
+    """
+    if not ensure_trajectories(ld):
+        # The trajectories were just built from the history, which includes these ratings
+        return
+    for bot, rating in ratings.items():
+        point = (time_stamp, rating.mu, rating.sigma)
+        _append_line(trajectory_file(ld, bot), point)
+        for period, to_period in PERIODS.items():
+            path = trajectory_file(ld, bot, period)
+            last = _last_line(path)
+            if last is not None and last[1][0] == to_period(time_stamp):
+                _truncate(path, last[0])
+            _append_line(path, (to_period(time_stamp),) + point[1:])
+
+
+def truncate_ratings(ld: LeagueDir, bots: Iterable[BotID], time_stamp: str):
+    """
+    Remove the points at or after the given time stamp from the trajectories of the given bots.
+    Used when matches are undone.
+    """
+    if not ld.trajectories.exists():
+        return
+    key = time_stamp.ljust(TIME_STAMP_LENGTH, "0")
+    for bot in set(bots):
+        path = trajectory_file(ld, bot)
+        last = _last_line(path)
+        while last is not None and last[1][0].ljust(TIME_STAMP_LENGTH, "0") >= key:
+            _truncate(path, last[0])
+            last = _last_line(path)
+
+        # Drop the periods from the time stamp and onwards. The remaining points of the first of those periods
+        # are before the time stamp, so the new last point of that period (if any) is the last point of the bot.
+        for period, to_period in PERIODS.items():
+            first_period = to_period(time_stamp)
+            period_path = trajectory_file(ld, bot, period)
+            last_period = _last_line(period_path)
+            while last_period is not None and last_period[1][0] >= first_period:
+                _truncate(period_path, last_period[0])
+                last_period = _last_line(period_path)
+            if last is not None and to_period(last[1][0]) == first_period:
+                _append_line(period_path, (first_period,) + tuple(last[1][1:]))
+
+
+def ensure_trajectories(ld: LeagueDir) -> bool:
+    """
+    Build the trajectories from the rankings history, if they do not exist. Returns true if they existed.
+    """
+    if ld.trajectories.exists():
+        return True
+    # Avoid circular import
+    from ranking_system import RankingSystem
+
+    tmp = ld.trajectories.with_name(ld.trajectories.name + ".tmp")
+    tmp.mkdir(parents=True, exist_ok=True)
+    for old in tmp.iterdir():
+        old.unlink()
+
+    points: Dict[BotID, List[Point]] = {}
+    last: Dict[BotID, Tuple[float, float]] = {}
+    for path in ld.history(ld.rankings):
+        time_stamp = history_time_stamp(path)
+        for bot, rating in RankingSystem.read(path).ratings.items():
+            if last.get(bot) != (rating.mu, rating.sigma):
+                last[bot] = (rating.mu, rating.sigma)
+                points.setdefault(bot, []).append((time_stamp, rating.mu, rating.sigma))
+
+    for bot, bot_points in points.items():
+        _write_lines(tmp / trajectory_file(ld, bot).name, bot_points)
+        for period, to_period in PERIODS.items():
+            downsampled = {}
+            for point in bot_points:
+                downsampled[to_period(point[0])] = point[1:]
+            _write_lines(tmp / trajectory_file(ld, bot, period).name,
+                         [(time,) + values for time, values in downsampled.items()])
+    tmp.rename(ld.trajectories)
+    return False
+
+
+def _write_lines(path: Path, points: List[tuple]):
+    with open(path, 'w', encoding='utf8') as f:
+        for point in points:
+            f.write(json.dumps(point) + "\n")
+
+
+def _append_line(path: Path, point: tuple):
+    with open(path, 'a', encoding='utf8') as f:
+        f.write(json.dumps(point) + "\n")
+
+
+def _last_line(path: Path) -> Optional[Tuple[int, list]]:
+    """
+    Returns the byte offset and the value of the last line of the file, or None if the file is empty or missing.
+    Only the end of the file is read.
+    """
+    if not path.exists():
+        return None
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        start = max(0, size - 1024)
+        while True:
+            f.seek(start)
+            data = f.read()
+            i = data.rstrip(b"\n").rfind(b"\n")
+            if i != -1 or start == 0:
+                break
+            # The last line is longer than what we read
+            start = max(0, start - 4096)
+    line = data[i + 1:].strip()
+    if not line:
+        return None
+    return start + i + 1, json.loads(line)
+
+
+def _truncate(path: Path, offset: int):
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
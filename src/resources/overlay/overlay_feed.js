@@ -0,0 +1,112 @@
+// Delivers the json documents of the overlay (current_match, summary, ...) to the page.
+// When the page is served by `autoleague overlay serve`, the documents are pushed through a WebSocket
+// as versioned patches. Otherwise, e.g. when the page is opened as a local file, the json files are polled.
+const overlayFeed = (function () {
+    const POLL_INTERVAL = 2000;
+    const RECONNECT_DELAY = 1000;
+
+    const subscribers = {};
+    const polled = {};
+    let docs = {};
+    let version = null;
+    let pushing = location.protocol === "http:" || location.protocol === "https:";
+
+    function notify(name) {
+        for (const callback of subscribers[name] || []) {
+            callback(docs[name]);
+        }
+    }
+
+    function applyPatch(doc, ops) {
+        for (const op of ops) {
+            if (op.path.length === 0) {
+                doc = op.value;
+                continue;
+            }
+            let parent = doc;
+            for (const key of op.path.slice(0, -1)) {
+                parent = parent[key];
+            }
+            const last = op.path[op.path.length - 1];
+            if (op.op === "remove") {
+                delete parent[last];
+            } else {
+                parent[last] = op.value;
+            }
+        }
+        return doc;
+    }
+
+    function connect() {
+        const socket = new WebSocket(`ws://${location.host}/ws`);
+        let opened = false;
+        socket.onopen = () => opened = true;
+        socket.onmessage = function (event) {
+            const message = JSON.parse(event.data);
+            if (message.type === "snapshot") {
+                docs = message.docs;
+                version = message.version;
+                for (const name of Object.keys(docs)) {
+                    notify(name);
+                }
+            } else if (message.type === "patch") {
+                if (version === null || message.version !== version + 1) {
+                    // We missed a patch. Reconnecting gives us a fresh snapshot
+                    socket.close();
+                    return;
+                }
+                docs[message.doc] = applyPatch(docs[message.doc], message.ops);
+                version = message.version;
+                notify(message.doc);
+            }
+        };
+        socket.onclose = function () {
+            version = null;
+            if (opened) {
+                setTimeout(connect, RECONNECT_DELAY);
+            } else {
+                // The page is not served by the overlay server. Fall back to polling
+                pushing = false;
+                for (const name of Object.keys(subscribers)) {
+                    poll(name);
+                }
+            }
+        };
+    }
+
+    function poll(name) {
+        if (polled[name]) return;
+        polled[name] = true;
+        let previous = null;
+
+        function update() {
+            $.get(`${name}.json`, function (json) {
+                // In normal browsers (not OBS), json is already an object and not a string
+                const text = typeof json === "string" ? json : JSON.stringify(json);
+                if (text !== previous) {
+                    previous = text;
+                    docs[name] = typeof json === "string" ? JSON.parse(json) : json;
+                    notify(name);
+                }
+            });
+        }
+
+        update();
+        setInterval(update, POLL_INTERVAL);
+    }
+
+    if (pushing) connect();
+
+    return {
+        // Call the callback with the document of the given name now (if known) and whenever it changes
+        subscribe(name, callback) {
+            (subscribers[name] = subscribers[name] || []).push(callback);
+            if (name in docs) callback(docs[name]);
+            if (!pushing) poll(name);
+        },
+        // Returns the latest known version of the document of the given name
+        get(name) {
+            return docs[name];
+        },
+    };
+})();
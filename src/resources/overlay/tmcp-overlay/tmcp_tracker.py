@@ -1,5 +1,8 @@
 import json
-from typing import List, Optional
+import os
+import time
+from collections import deque
+from typing import List, Optional, Any
 from pathlib import Path
 
 from tmcp import TMCP_VERSION, ActionType
@@ -10,6 +13,123 @@ from rlbot.agents.base_script import BaseScript
 from rlbot.utils.structures.game_data_struct import GameTickPacket
 
 
+# Default maximum number of times per second the overlay's data file is written.
+# The league's `tmcp_write_rate` setting is used instead when a league is set up.
+MAX_WRITES_PER_SECOND = 10.0
+
+# The autoleague's settings file, which points to the league directory
+AUTOLEAGUE_SETTINGS = Path(__file__).absolute().parents[3] / "settings.json"
+
+
+def load_max_write_rate() -> float:
+    """
+    Returns the league's configured maximum write rate, or the default if no league is set up.
+    The script is started by RLBot, so the settings files are read directly instead of through the autoleague modules.
+    """
+    try:
+        with open(AUTOLEAGUE_SETTINGS) as f:
+            league_dir_raw = json.load(f).get("league_dir_raw")
+        if league_dir_raw is None:
+            return MAX_WRITES_PER_SECOND
+        with open(Path(league_dir_raw) / "league_settings.json") as f:
+            return float(json.load(f).get("tmcp_write_rate", MAX_WRITES_PER_SECOND))
+    except (OSError, ValueError):
+        return MAX_WRITES_PER_SECOND
+
+
+def write_text_atomic(path: Path, text: str) -> bool:
+    """
+    Write text to the given file by writing to a temporary file and renaming it into place, such that readers
+    never see a partially written file. The rename is attempted once. Returns false if it failed because a reader
+    has the file open (on Windows), in which case the caller should try again later.
+    """
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        if isinstance(e, PermissionError):
+            return False
+        raise
+
+
+class ThrottledJsonWriter:
+    """
+    Writes json data to a file at most `max_rate` times per second. Data submitted between writes is
+    coalesced, such that only the newest data is written. Writes are skipped if the serialized data is
+    identical to what was last written. The file is written atomically, so readers never see a partially written
+    file. If a write fails, the data stays pending and the write is retried on a later flush.
+    Counters of messages, submits, and writes are recorded per second in `history` and in the stats file.
+    """
+
+    def __init__(self, path: Path, max_rate: float = MAX_WRITES_PER_SECOND, stats_path: Optional[Path] = None):
+        self.path = path
+        self.stats_path = stats_path
+        self.min_interval = 1.0 / max_rate
+        self.history = deque(maxlen=60)
+        self._pending: Optional[Any] = None
+        self._last_text: Optional[str] = None
+        self._last_write_time = 0.0
+        self._second = int(time.monotonic())
+        self._counters = self._new_counters()
+
+    @staticmethod
+    def _new_counters() -> dict:
+        return {"messages": 0, "submits": 0, "writes": 0, "unchanged": 0}
+
+    def count_messages(self, count: int):
+        self._counters["messages"] += count
+
+    def submit(self, data: Any):
+        """
+        Submit new data to be written. The data is written by a later call to `flush`.
+        """
+        self._pending = data
+        self._counters["submits"] += 1
+
+    def flush(self):
+        """
+        Write the pending data, if any, unless the last write was too recent. Call this every tick.
+        """
+        now = time.monotonic()
+        self._roll_counters(now)
+        if self._pending is None or now - self._last_write_time < self.min_interval:
+            return
+
+        text = json.dumps(self._pending)
+        if text == self._last_text:
+            self._pending = None
+            self._counters["unchanged"] += 1
+            return
+
+        # Failed writes count toward the rate too, such that a locked file is not retried every tick.
+        # The pending data is only cleared once it is written, such that a failed write is retried by a later flush.
+        self._last_write_time = now
+        if not write_text_atomic(self.path, text):
+            return
+        self._pending = None
+        self._last_text = text
+        self._counters["writes"] += 1
+
+    def _roll_counters(self, now: float):
+        second = int(now)
+        if second == self._second:
+            return
+        self.history.append(self._counters)
+        self._counters = self._new_counters()
+        self._second = second
+        if self.stats_path is not None:
+            # The stats are written again next second, so a failed write is not retried
+            write_text_atomic(self.stats_path, json.dumps(
+                {"max_writes_per_second": 1.0 / self.min_interval, "per_second": list(self.history)}))
+
+
 class TMCPHandler(TMCPHandlerForBots):
     def __init__(self, matchcomms: MatchcommsClient):
         self.matchcomms: MatchcommsClient = matchcomms
@@ -31,12 +151,15 @@ class TMCPOverlay(BaseScript):
         self.tmcp_handler = TMCPHandler(self.matchcomms)
         self.action_cache: List[dict] = {}
         self.data_path = Path(__file__).parent / "overlay" / "data.json"
+        self.writer = ThrottledJsonWriter(self.data_path, max_rate=load_max_write_rate(),
+                                          stats_path=Path(__file__).parent / "overlay" / "stats.json")
         self.__last_active = False
 
     def run(self):
         while True:
             packet: GameTickPacket = self.wait_game_tick_packet()
             new_messages: List[dict] = self.tmcp_handler.recv()
+            self.writer.count_messages(len(new_messages))
 
             for message in new_messages:
                 try:
@@ -62,11 +185,13 @@ class TMCPOverlay(BaseScript):
                     "names": [car.name for car in packet.game_cars[:packet.num_cars]],
                 }
 
-                try:
-                    with open(self.data_path, "w") as file:
-                        json.dump(data, file, indent=4)
-                except Exception:
-                    pass
+                self.writer.submit(data)
+
+            try:
+                self.writer.flush()
+            except OSError as e:
+                # The data stays pending, so the write is retried by a later flush
+                print(f"Failed to write {self.data_path}: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy
+
+from bots import BotID
+from match import MatchDetails
+from paths import LeagueDir
+from ranking_system import RankingSystem
+
+
+@dataclass
+class WinMatrix:
+    """
+    Head-to-head results of all bots. `wins[i, j]` is the number of times bot i was on the winning team
+    while bot j was on the losing team, so the losses are the transpose of the wins. `draws[i, j]` is the number
+    of drawn matches where bot i and bot j were on opposite teams, so it is symmetric.
+    The bots are sorted by their current mmr.
+    """
+    bots: List[BotID]
+    wins: numpy.ndarray
+    draws: numpy.ndarray
+
+    @property
+    def losses(self) -> numpy.ndarray:
+        return self.wins.T
+
+    @property
+    def win_rate(self) -> numpy.ndarray:
+        """
+        The fraction of games bot i won against bot j, or NaN if they never met. Draws count as games not won.
+        """
+        games = self.wins + self.losses + self.draws
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(games > 0, self.wins / games, numpy.nan)
+
+    @staticmethod
+    def make(ld: LeagueDir) -> 'WinMatrix':
+        """
+        Count the wins of all bot pairs in one pass over the match history
+        """
+        ranks = RankingSystem.load(ld)
+        bots = sorted(ranks.ratings.keys(), key=lambda bot: -ranks.get_mmr(bot))
+        return WinMatrix.of((MatchDetails.read(path) for path in ld.history(ld.matches)), bots)
+
+    @staticmethod
+    def of(matches: Iterable[MatchDetails], bots: List[BotID]) -> 'WinMatrix':
+        """
+        Count the wins and draws of all bot pairs in the given matches. The matrices are ordered like the given
+        bots, followed by any other bots of the matches in order of appearance.
+        """
+        bots = list(bots)
+        index = {bot: i for i, bot in enumerate(bots)}
+
+        winners = []
+        losers = []
+        drawn = []
+        for match in matches:
+            for bot in match.blue + match.orange:
+                if bot not in index:
+                    index[bot] = len(bots)
+                    bots.append(bot)
+            blue = [index[bot] for bot in match.blue]
+            orange = [index[bot] for bot in match.orange]
+            if match.result.blue_goals > match.result.orange_goals:
+                winners.append(blue)
+                losers.append(orange)
+            elif match.result.blue_goals < match.result.orange_goals:
+                winners.append(orange)
+                losers.append(blue)
+            else:
+                drawn.append((blue, orange))
+
+        wins = numpy.zeros((len(bots), len(bots)), dtype=numpy.int32)
+        _add_pairs(wins, winners, losers)
+        draws = numpy.zeros((len(bots), len(bots)), dtype=numpy.int32)
+        _add_pairs(draws, [blue for blue, _ in drawn], [orange for _, orange in drawn])
+        draws += draws.T
+        return WinMatrix(bots, wins, draws)
+
+    def save(self, path: Path):
+        numpy.savez_compressed(
+            path,
+            bot_names=numpy.array(self.bots, dtype=str),
+            wins=self.wins,
+            losses=self.losses,
+            draws=self.draws,
+            win_rate=self.win_rate,
+        )
+
+    def render(self, path: Path) -> bool:
+        """
+        Draw the win rate matrix and the sigmoid of the win differences to an image.
+        Returns false if matplotlib is not installed.
+        """
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+        except ImportError:
+            return False
+
+        n = len(self.bots)
+        win_diff = self.wins - self.losses
+        sigmoid_wins = 2.0 / (1.0 + numpy.exp(-win_diff)) - 1.0
+
+        fig, axes = plt.subplots(1, 2, figsize=(20.0, 10.0))
+        for ax, data, cmap, title in [
+            (axes[0], numpy.ma.masked_invalid(self.win_rate), "RdYlGn", "Win rate matrix"),
+            (axes[1], sigmoid_wins, "RdYlGn", "Sigmoid wins matrix"),
+        ]:
+            image = ax.imshow(data, cmap=cmap)
+            ax.set_facecolor("black")
+            ax.set_xticks(range(n), labels=self.bots, rotation=90)
+            ax.set_yticks(range(n), labels=self.bots)
+            ax.set_title(title)
+            fig.colorbar(image, ax=ax, fraction=0.046)
+        fig.tight_layout()
+        fig.savefig(path)
+        plt.close(fig)
+        return True
+
+
+def _add_pairs(matrix: numpy.ndarray, rows: List[List[int]], cols: List[List[int]]):
+    """
+    Add 1 to the matrix for every pair of a bot in `rows[k]` and a bot in `cols[k]` for each match k
+    """
+    if rows:
+        rows = numpy.array(rows)
+        cols = numpy.array(cols)
+        pair_rows = numpy.repeat(rows, cols.shape[1], axis=1)
+        pair_cols = numpy.tile(cols, rows.shape[1])
+        numpy.add.at(matrix, (pair_rows.ravel(), pair_cols.ravel()), 1)
+
+
+def make_win_matrix(ld: LeagueDir, render: bool = False) -> WinMatrix:
+    """
+    Compute the win matrices and save them to the stats directory. Rendering the image is optional,
+    so this can run on a server without a display or matplotlib.
+    """
+    matrix = WinMatrix.make(ld)
+    matrix.save(ld.win_matrix)
+    print(f"Saved win matrices of {len(matrix.bots)} bots to {ld.win_matrix}")
+    if render:
+        if matrix.render(ld.win_matrix_image):
+            print(f"Rendered win matrices to {ld.win_matrix_image}")
+        else:
+            print("Rendering requires matplotlib. Install it with 'pip install matplotlib'")
+    return matrix
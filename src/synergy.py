@@ -0,0 +1,88 @@
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from bots import BotID
+from match import MatchDetails
+from match_stats import MatchStatsStore
+from paths import LeagueDir
+
+# The index of each count in a pair record
+GAMES, WINS, GOALS_FOR, GOALS_AGAINST = range(4)
+
+
+class SynergyStats(MatchStatsStore):
+    """
+    Per-pair records of how bots do together on the same team and against each other. Each record is a list
+    of [games, wins, goals for, goals against] seen from the first bot of the pair, e.g. `teammates[a][b][WINS]`
+    is the number of wins of bot a when playing with bot b. The stats are saved in the stats directory and
+    updated once per match, so queries do not require reading all the matches. Adding a match updates
+    O(team size^2) records in memory, but loading and saving the stats still read and write the records of
+    all pairs.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.teammates: Dict[BotID, Dict[BotID, List[int]]] = {}
+        self.opponents: Dict[BotID, Dict[BotID, List[int]]] = {}
+
+    def _add_match(self, match: MatchDetails, sign: int):
+        """
+        Add the pairs of the given match to the stats. A sign of -1 removes the match again.
+        """
+        blue_goals = match.result.blue_goals
+        orange_goals = match.result.orange_goals
+        for team, opponents, goals_for, goals_against in [
+            (match.blue, match.orange, blue_goals, orange_goals),
+            (match.orange, match.blue, orange_goals, blue_goals),
+        ]:
+            record = [1, int(goals_for > goals_against), goals_for, goals_against]
+            for bot in team:
+                for teammate in team:
+                    if teammate != bot:
+                        self._add_record(self.teammates, bot, teammate, record, sign)
+                for opponent in opponents:
+                    self._add_record(self.opponents, bot, opponent, record, sign)
+
+    @staticmethod
+    def _add_record(pairs: Dict[BotID, Dict[BotID, List[int]]], bot: BotID, other: BotID, record: List[int],
+                    sign: int):
+        current = pairs.setdefault(bot, {}).setdefault(other, [0, 0, 0, 0])
+        for i, value in enumerate(record):
+            current[i] += sign * value
+        # Keep the stats compact when matches are removed
+        if current[GAMES] == 0:
+            del pairs[bot][other]
+            if not pairs[bot]:
+                del pairs[bot]
+
+    def teammate_records(self, bot: BotID) -> List[Tuple[BotID, List[int]]]:
+        """
+        Returns the records of the given bot with each of its teammates, best win rate first
+        """
+        return self._sorted_records(self.teammates.get(bot, {}))
+
+    def opponent_records(self, bot: BotID) -> List[Tuple[BotID, List[int]]]:
+        """
+        Returns the records of the given bot against each of its opponents, best win rate first
+        """
+        return self._sorted_records(self.opponents.get(bot, {}))
+
+    @staticmethod
+    def _sorted_records(records: Dict[BotID, List[int]]) -> List[Tuple[BotID, List[int]]]:
+        return sorted(records.items(), key=lambda item: (-item[1][WINS] / item[1][GAMES], -item[1][GAMES], item[0]))
+
+    @staticmethod
+    def file(ld: LeagueDir) -> Path:
+        return ld.synergy
+
+
+def print_synergy(stats: SynergyStats, bot: BotID):
+    for title, records in [
+        ("Teammates", stats.teammate_records(bot)),
+        ("Opponents", stats.opponent_records(bot)),
+    ]:
+        print(f"{title} of {bot}:")
+        print(f"{'':<32} {'games':>5} {'wins':>5} {'rate':>5} {'gf':>5} {'ga':>5}")
+        for other, record in records:
+            games, wins, goals_for, goals_against = record
+            print(f"{other:.<32} {games:>5} {wins:>5} {wins / games:>5.2f} {goals_for:>5} {goals_against:>5}")
@@ -0,0 +1,164 @@
+import json
+import struct
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import numpy
+
+MAGIC = b"ALTM"
+VERSION = 1
+MAX_PLAYERS = 6
+
+# One record per sample:
+#   game time (seconds elapsed), game time remaining, match phase, blue score, orange score, number of players,
+#   ball location (x, y, z), and for each player: location (x, y, z) and boost
+RECORD = struct.Struct("<ffBBBB3f" + "4f" * MAX_PLAYERS)
+RECORD_DTYPE = numpy.dtype([
+    ("time", "<f4"),
+    ("time_remaining", "<f4"),
+    ("phase", "u1"),
+    ("blue_score", "u1"),
+    ("orange_score", "u1"),
+    ("num_players", "u1"),
+    ("ball", "<f4", (3,)),
+    ("players", "<f4", (MAX_PLAYERS, 4)),
+])
+assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class TelemetryRecorder:
+    """
+    Records samples of the game packet to a binary file with fixed-width records (see `RECORD`). The file starts
+    with `MAGIC`, the length of a json header, and the json header itself, followed by the records.
+    Samples are packed into a preallocated buffer, which is written to the file when it is full and when the
+    recorder is closed, so sampling does no allocations and rarely any IO.
+    Use `read_telemetry` to read the file.
+    """
+
+    def __init__(self, path: Path, rate: float, player_names: List[str], buffer_size: int = 1024):
+        self.path = path
+        self.interval = 1.0 / rate
+        self.sample_count = 0
+        self._buffer = bytearray(RECORD.size * buffer_size)
+        self._capacity = buffer_size
+        self._buffered = 0
+        self._next_sample_time = 0.0
+        self._player_values = [0.0] * (4 * MAX_PLAYERS)
+
+        header = json.dumps({
+            "version": VERSION,
+            "rate": rate,
+            "max_players": MAX_PLAYERS,
+            "players": player_names,
+        }).encode('utf8')
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def __enter__(self) -> 'TelemetryRecorder':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def maybe_sample(self, packet):
+        """
+        Sample the packet if at least `1 / rate` seconds have passed since the last sample
+        """
+        now = time.perf_counter()
+        if now >= self._next_sample_time:
+            self._next_sample_time = now + self.interval
+            self.sample(packet)
+
+    def sample(self, packet):
+        """
+        Add a record of the given packet
+        """
+        match_info = packet.match_info
+        ball = packet.balls[0].physics.location if len(packet.balls) > 0 else None
+        players = packet.players[:MAX_PLAYERS]
+
+        values = self._player_values
+        for i, player in enumerate(players):
+            location = player.physics.location
+            values[4 * i] = location.x
+            values[4 * i + 1] = location.y
+            values[4 * i + 2] = location.z
+            values[4 * i + 3] = player.boost
+
+        RECORD.pack_into(
+            self._buffer, self._buffered * RECORD.size,
+            match_info.seconds_elapsed,
+            match_info.game_time_remaining,
+            int(match_info.match_phase),
+            min(packet.teams[0].score, 255),
+            min(packet.teams[1].score, 255),
+            len(players),
+            ball.x if ball else 0.0, ball.y if ball else 0.0, ball.z if ball else 0.0,
+            *values,
+        )
+        self._buffered += 1
+        self.sample_count += 1
+        if self._buffered == self._capacity:
+            self.flush()
+
+    def flush(self):
+        self._file.write(memoryview(self._buffer)[:self._buffered * RECORD.size])
+        self._buffered = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def pending_telemetry_path(path: Path) -> Path:
+    """
+    Returns the temporary path that the telemetry file at the given path is recorded to. The file is only
+    renamed to its final path when the match is committed, so matches that never finish leave no telemetry.
+    """
+    return path.with_name(f".{path.name}.tmp")
+
+
+def read_telemetry(path: Path) -> Tuple[dict, numpy.ndarray]:
+    """
+    Read a telemetry file. Returns the header and a numpy structured array of the records (see `RECORD_DTYPE`).
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a telemetry file")
+        header_length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+        records = numpy.frombuffer(f.read(), dtype=RECORD_DTYPE)
+    return header, records
+
+
+def benchmark(samples: int = 100_000, path: Optional[Path] = None):
+    """
+    Measure the cost of recording a sample. Uses a packet-like object with 6 players.
+    """
+    vec = SimpleNamespace(x=1.0, y=2.0, z=3.0)
+    physics = SimpleNamespace(location=vec)
+    packet = SimpleNamespace(
+        match_info=SimpleNamespace(seconds_elapsed=12.5, game_time_remaining=287.5, match_phase=2),
+        balls=[SimpleNamespace(physics=physics)],
+        players=[SimpleNamespace(physics=physics, boost=33.0) for _ in range(6)],
+        teams=[SimpleNamespace(score=1), SimpleNamespace(score=2)],
+    )
+    path = path or Path("telemetry_benchmark.tlm")
+    try:
+        with TelemetryRecorder(path, rate=120.0, player_names=[f"bot{i}" for i in range(6)]) as recorder:
+            start = time.perf_counter()
+            for _ in range(samples):
+                recorder.sample(packet)
+            elapsed = time.perf_counter() - start
+        size = path.stat().st_size
+    finally:
+        path.unlink(missing_ok=True)
+    print(f"Recorded {samples} samples in {elapsed:.3f} s: {elapsed / samples * 1e6:.2f} us per sample, "
+          f"{RECORD.size} bytes per sample, {size / 1e6:.1f} MB in total")
+
+
+if __name__ == '__main__':
+    benchmark()
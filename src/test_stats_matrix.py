@@ -0,0 +1,36 @@
+import numpy
+
+from match import MatchDetails, MatchResult
+from stats_matrix import WinMatrix
+
+
+def make_match(blue, orange, blue_goals, orange_goals) -> MatchDetails:
+    return MatchDetails(blue=blue, orange=orange, result=MatchResult(blue_goals=blue_goals, orange_goals=orange_goals))
+
+
+def test_wins_and_losses():
+    matrix = WinMatrix.of([make_match(["a"], ["b"], 2, 1), make_match(["a"], ["b"], 0, 3)], ["a", "b"])
+    assert matrix.wins.tolist() == [[0, 1], [1, 0]]
+    assert matrix.losses.tolist() == [[0, 1], [1, 0]]
+    assert matrix.draws.tolist() == [[0, 0], [0, 0]]
+    assert matrix.win_rate[0, 1] == 0.5
+
+
+def test_draws_are_not_wins():
+    matrix = WinMatrix.of([make_match(["a", "b"], ["c", "d"], 1, 1), make_match(["a", "b"], ["c", "d"], 1, 0)],
+                          ["a", "b", "c", "d"])
+    # The draw is counted for each pair of opponents, and not as a win of either team
+    assert matrix.wins[2:, :2].sum() == 0
+    assert matrix.wins[:2, 2:].tolist() == [[1, 1], [1, 1]]
+    assert numpy.array_equal(matrix.draws, matrix.draws.T)
+    assert matrix.draws[:2, 2:].tolist() == [[1, 1], [1, 1]]
+    assert matrix.draws[:2, :2].sum() == 0
+    assert matrix.win_rate[0, 2] == 0.5
+    assert matrix.win_rate[2, 0] == 0.0
+
+
+def test_unknown_bots_are_appended():
+    matrix = WinMatrix.of([make_match(["c"], ["a"], 0, 1)], ["a", "b"])
+    assert matrix.bots == ["a", "b", "c"]
+    assert matrix.wins[0, 2] == 1
+    assert numpy.isnan(matrix.win_rate[0, 1])